@@ -0,0 +1,120 @@
+#!/usr/bin/python
+
+# block_size.py
+#
+# Mike Bonnington <mjbonnington@gmail.com>
+# (c) 2018-2022
+#
+# Environment Block Size
+# A panel showing the total size of the environment block compared with the
+# system limit, the largest variables and the bytes wasted on duplicate path
+# entries. Offers a one-click action to compact all path-list variables.
+
+
+import os
+
+from Qt import QtCore, QtGui, QtWidgets
+import ui_template as UI
+
+# Import custom modules
+import envstore
+
+
+# ----------------------------------------------------------------------------
+# Configuration
+# ----------------------------------------------------------------------------
+
+cfg = dict(
+	app_id="ic_envvar",  # This should match the Rez package name
+	app_name="Environment Block Size",
+	window_object="blockSizeUI",
+
+	ui_file=os.path.join(os.path.dirname(__file__), 'forms', 'block_size.ui'),
+	stylesheet=None,
+
+	store_window_geometry=True,
+)
+
+# Number of variables listed in the panel
+LARGEST_COUNT = 50
+
+# ----------------------------------------------------------------------------
+# Main dialog class
+# ----------------------------------------------------------------------------
+
+class Dialog(QtWidgets.QDialog, UI.TemplateUI):
+	"""Environment Block Size panel class.
+
+	The panel is modeless. It reads the running totals kept by the parent
+	browser's BlockSizeAnalyzer, so refreshing it never rescans the
+	environment.
+	"""
+	def __init__(self, parent=None):
+		super(Dialog, self).__init__(parent)
+		self.parent = parent
+
+		# UI template setup
+		self.setupUI(**cfg)
+
+		# Set window icon, flags and other Qt attributes
+		self.setWindowFlags(QtCore.Qt.Dialog)
+
+		# Connect signals & slots
+		self.ui.compact_pushButton.clicked.connect(self.compact)
+		self.ui.buttonBox.button(QtWidgets.QDialogButtonBox.Close).clicked.connect(self.close)
+
+
+	def display(self, analyzer):
+		"""Display the panel for the given analyzer."""
+
+		self.analyzer = analyzer
+		self.refresh()
+		self.show()
+		self.raise_()
+
+
+	def refresh(self):
+		"""Update the panel from the analyzer's running totals."""
+
+		analyzer = self.analyzer
+		summary = "Environment block: %s in %d variables." % (
+			envstore.formatBytes(analyzer.total), len(analyzer.sizes))
+		usage = analyzer.usage()
+		if usage is None:
+			summary += " System limit unknown."
+			self.ui.usage_progressBar.hide()
+		else:
+			summary += " System limit: %s (%.1f%% used)." % (
+				envstore.formatBytes(analyzer.limit), usage*100)
+			self.ui.usage_progressBar.show()
+			self.ui.usage_progressBar.setValue(min(100, int(usage*100)))
+		summary += "\n%s wasted on duplicate path entries." % (
+			envstore.formatBytes(analyzer.totalDuplicates))
+		oversized = analyzer.oversized()
+		if oversized:
+			summary += "\nToo long to pass to a new process: %s" % ", ".join(sorted(oversized))
+		self.ui.summary_label.setText(summary)
+
+		tree = self.ui.largest_treeWidget
+		tree.clear()
+		for key, size in analyzer.largest(LARGEST_COUNT):
+			item = QtWidgets.QTreeWidgetItem(tree)
+			item.setText(0, envstore.displayValue(key))
+			item.setText(1, envstore.formatBytes(size))
+			item.setText(2, envstore.formatBytes(analyzer.duplicates.get(key, 0)))
+			item.setTextAlignment(1, QtCore.Qt.AlignRight)
+			item.setTextAlignment(2, QtCore.Qt.AlignRight)
+		tree.resizeColumnToContents(0)
+
+
+	def compact(self):
+		"""Compact all path-list variables in the parent browser."""
+
+		removeMissing = self.getCheckBoxValue(self.ui.removeMissing_checkBox)
+		self.parent.compactPaths(removeMissing=removeMissing)
+
+
+	def hideEvent(self, event):
+		"""Event handler for when window is hidden."""
+
+		self.storeWindow()  # Store window geometry
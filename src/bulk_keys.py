@@ -0,0 +1,215 @@
+#!/usr/bin/python
+
+# bulk_keys.py
+#
+# Mike Bonnington <mjbonnington@gmail.com>
+# (c) 2018-2022
+#
+# Select, Delete or Rename by Pattern
+# A dialog for operating on many environment variables at once by matching
+# their keys against a wildcard pattern, e.g. purging stale REZ_* variables
+# or renaming OLD_PREFIX_* to NEW_PREFIX_*. The browser applies the chosen
+# operation to the environment as a single batch.
+
+
+import os
+import re
+
+from Qt import QtCore, QtGui, QtWidgets
+import ui_template as UI
+
+# Import custom modules
+import envstore
+
+
+# ----------------------------------------------------------------------------
+# Configuration
+# ----------------------------------------------------------------------------
+
+cfg = dict(
+	app_id="ic_envvar",  # This should match the Rez package name
+	app_name="Select, Delete or Rename by Pattern",
+	window_object="bulkKeysUI",
+
+	ui_file=os.path.join(os.path.dirname(__file__), 'forms', 'bulk_keys.ui'),
+	stylesheet=None,
+
+	store_window_geometry=False,
+)
+
+# Operations, set on the dialog when it is accepted
+SELECT = 'select'
+DELETE = 'delete'
+RENAME = 'rename'
+
+VALID_KEY = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_]*$')
+
+# ----------------------------------------------------------------------------
+# Pattern functions
+# ----------------------------------------------------------------------------
+
+def compilePattern(pattern):
+	"""Compile a wildcard pattern to a regular expression in which each '*'
+	or '?' wildcard is a capturing group. Matching is case-sensitive.
+	"""
+	regex = ""
+	for char in pattern:
+		if char == '*':
+			regex += '(.*)'
+		elif char == '?':
+			regex += '(.)'
+		else:
+			regex += re.escape(char)
+	return re.compile(regex + r'\Z')
+
+
+def matchKeys(keys, pattern):
+	"""Return a list of the keys matching the wildcard pattern."""
+
+	if not pattern:
+		return []
+	match = compilePattern(pattern).match
+	return [key for key in keys if match(key)]
+
+
+def computeRenames(keys, pattern, replacement, caseSensitive=True):
+	"""Compute new keys for every key matching the wildcard pattern.
+
+	Each wildcard in the replacement is filled with the text matched by the
+	corresponding wildcard in the pattern. Return a tuple containing a
+	dictionary mapping old keys to new keys (unchanged keys are omitted) and
+	a list of error messages. The renames must not be applied if there are
+	any errors. If 'caseSensitive' is False, new keys clash with keys which
+	differ only in case.
+	"""
+	renames = {}
+	errors = []
+	if not pattern or not replacement:
+		return renames, errors
+
+	regex = compilePattern(pattern)
+	parts = re.split(r'([*?])', replacement)
+
+	for key in keys:
+		match = regex.match(key)
+		if not match:
+			continue
+		groups = iter(match.groups())
+		newKey = "".join(next(groups, "") if part in ('*', '?') else part for part in parts)
+		if newKey != key:
+			renames[key] = newKey
+
+	# Check for invalid and clashing keys
+	fold = (lambda key: key) if caseSensitive else (lambda key: key.upper())
+	existing = dict((fold(key), key) for key in keys)
+	renamed = set(fold(key) for key in renames)
+	targets = {}
+	for key, newKey in renames.items():
+		if not VALID_KEY.match(newKey):
+			errors.append("'%s' is not a valid key." % newKey)
+		target = fold(newKey)
+		if target in targets:
+			errors.append("Both '%s' and '%s' would be renamed to '%s'." % (targets[target], key, newKey))
+		targets[target] = key
+		if target in existing and target not in renamed:
+			errors.append("'%s' already exists." % existing[target])
+
+	return renames, errors
+
+# ----------------------------------------------------------------------------
+# Main dialog class
+# ----------------------------------------------------------------------------
+
+class Dialog(QtWidgets.QDialog, UI.TemplateUI):
+	"""Select, Delete or Rename by Pattern dialog class."""
+
+	def __init__(self, parent=None):
+		super(Dialog, self).__init__(parent)
+		self.parent = parent
+
+		# UI template setup
+		self.setupUI(**cfg)
+		self.conformFormLayoutLabels(self.ui)
+
+		# Set window icon, flags and other Qt attributes
+		self.setWindowIcon(self.iconSet('edit.svg', tintNormal=False))
+		self.setWindowFlags(QtCore.Qt.Dialog)
+		self.setAttribute(QtCore.Qt.WA_DeleteOnClose, True)
+
+		# Connect signals & slots
+		self.ui.pattern_lineEdit.textChanged.connect(self.updatePreview)
+		self.ui.rename_lineEdit.textChanged.connect(self.updatePreview)
+
+		self.ui.select_pushButton.clicked.connect(lambda: self.ok(SELECT))
+		self.ui.delete_pushButton.clicked.connect(lambda: self.ok(DELETE))
+		self.ui.rename_pushButton.clicked.connect(lambda: self.ok(RENAME))
+		self.ui.buttonBox.button(QtWidgets.QDialogButtonBox.Cancel).clicked.connect(self.reject)
+
+		self.operation = None
+		self.keys = []
+		self.renames = {}
+
+
+	def display(self, keys, pattern="", caseSensitive=True):
+		"""Display the dialog for the given list of keys."""
+
+		self.allKeys = keys
+		self.caseSensitive = caseSensitive
+		self.ui.pattern_lineEdit.setText(pattern)
+		self.updatePreview()
+
+		return self.exec_()
+
+
+	def updatePreview(self):
+		"""Match the pattern against all keys and update the preview."""
+
+		pattern = self.ui.pattern_lineEdit.text()
+		replacement = self.ui.rename_lineEdit.text()
+		self.keys = matchKeys(self.allKeys, pattern)
+		self.renames, errors = computeRenames(self.allKeys, pattern, replacement, self.caseSensitive)
+
+		tree = self.ui.preview_treeWidget
+		tree.setUpdatesEnabled(False)
+		tree.setSortingEnabled(False)
+		tree.clear()
+		for key in self.keys:
+			item = QtWidgets.QTreeWidgetItem(tree)
+			item.setText(0, envstore.displayValue(key))
+			item.setText(1, envstore.displayValue(self.renames.get(key, "")))
+		tree.setSortingEnabled(True)
+		tree.resizeColumnToContents(0)
+		tree.setUpdatesEnabled(True)
+
+		if errors:
+			status = " ".join(errors)
+		else:
+			status = "%d variable(s) match." % len(self.keys)
+		self.ui.status_label.setText(status)
+		self.ui.status_label.setToolTip("\n".join(errors))
+
+		self.ui.select_pushButton.setEnabled(bool(self.keys))
+		self.ui.delete_pushButton.setEnabled(bool(self.keys))
+		self.ui.rename_pushButton.setEnabled(bool(self.renames) and not errors)
+
+
+	def ok(self, operation):
+		"""Dialog accept function."""
+
+		self.operation = operation
+		self.accept()
+
+
+	def keyPressEvent(self, event):
+		"""Event handler to detect when key is pressed."""
+
+		# Prevent Enter / Esc keypresses triggering OK / Cancel buttons.
+		if event.key() == QtCore.Qt.Key_Return \
+		or event.key() == QtCore.Qt.Key_Enter:
+			return
+
+
+	def hideEvent(self, event):
+		"""Event handler for when window is hidden."""
+
+		self.storeWindow()  # Store window geometry
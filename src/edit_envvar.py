@@ -16,6 +16,7 @@ from Qt import QtCore, QtGui, QtWidgets
 import ui_template as UI
 
 # Import custom modules
+import profiler
 
 
 # ----------------------------------------------------------------------------
@@ -46,8 +47,9 @@ class Dialog(QtWidgets.QDialog, UI.TemplateUI):
 		self.parent = parent
 
 		# UI template setup
-		self.setupUI(**cfg)
-		self.conformFormLayoutLabels(self.ui)
+		with profiler.span('edit.setupUI'):
+			self.setupUI(**cfg)
+			self.conformFormLayoutLabels(self.ui)
 
 		# Set window icon, flags and other Qt attributes
 		self.setWindowIcon(self.iconSet('edit.svg', tintNormal=False))
@@ -55,12 +57,13 @@ class Dialog(QtWidgets.QDialog, UI.TemplateUI):
 		self.setAttribute(QtCore.Qt.WA_DeleteOnClose, True)
 
 		# Set icons
-		self.ui.browse_toolButton.setIcon(self.iconSet('folder-open.svg'))
-		self.ui.add_toolButton.setIcon(self.iconSet('add.svg'))
-		self.ui.remove_toolButton.setIcon(self.iconSet('remove.svg'))
-		self.ui.moveUp_toolButton.setIcon(self.iconSet('move-up.svg'))
-		self.ui.moveDown_toolButton.setIcon(self.iconSet('move-down.svg'))
-		self.ui.browseList_toolButton.setIcon(self.iconSet('folder-open.svg'))
+		with profiler.span('edit.icons'):
+			self.ui.browse_toolButton.setIcon(self.iconSet('folder-open.svg'))
+			self.ui.add_toolButton.setIcon(self.iconSet('add.svg'))
+			self.ui.remove_toolButton.setIcon(self.iconSet('remove.svg'))
+			self.ui.moveUp_toolButton.setIcon(self.iconSet('move-up.svg'))
+			self.ui.moveDown_toolButton.setIcon(self.iconSet('move-down.svg'))
+			self.ui.browseList_toolButton.setIcon(self.iconSet('folder-open.svg'))
 
 		# Connect signals & slots
 		self.ui.key_lineEdit.textChanged.connect(self.updateUI)
@@ -81,8 +84,16 @@ class Dialog(QtWidgets.QDialog, UI.TemplateUI):
 		self.ui.key_lineEdit.setValidator(alphanumeric_validator)
 
 
-	def display(self, key, value):
-		"""Display the dialog."""
+	def display(self, key, value, pathIndex=None, pathsep=os.pathsep):
+		"""Display the dialog.
+
+		'pathIndex' is an optional envindex.PathIndex used to find the other
+		variables which reference a path in the value list. 'pathsep' is the
+		path separator of the environment, which differs from os.pathsep if
+		a snapshot from another platform was loaded.
+		"""
+		self.pathIndex = pathIndex
+		self.pathsep = pathsep
 
 		if key:
 			self.setWindowTitle("%s: %s" % (self.windowTitle(), key))
@@ -94,12 +105,17 @@ class Dialog(QtWidgets.QDialog, UI.TemplateUI):
 		self.ui.value_lineEdit.setText(value)
 
 		# Set up list view if value contains multiple paths
-		if os.pathsep in value:  # Multi-path mode
+		if pathsep in value:  # Multi-path mode
 			self.updateValueList(value)
 			self.ui.value_lineEdit.textEdited.connect(self.updateValueList)
 			self.ui.valueList_frame.show()
 			self.addContextMenu(self.ui.browseList_toolButton, "Browse directory...", self.browseDirList)
 			self.addContextMenu(self.ui.browseList_toolButton, "Browse file...", self.browseFileList)
+			if pathIndex is not None:
+				findReferencesAction = QtWidgets.QAction("Find references", self.ui.valueList_listWidget)
+				findReferencesAction.triggered.connect(self.findReferences)
+				self.ui.valueList_listWidget.addAction(findReferencesAction)
+				self.ui.valueList_listWidget.setContextMenuPolicy(QtCore.Qt.ActionsContextMenu)
 			self.ui.browse_toolButton.hide()
 		else:  # Single value mode
 			self.ui.valueList_frame.hide()
@@ -130,10 +146,11 @@ class Dialog(QtWidgets.QDialog, UI.TemplateUI):
 			self.ui.browseList_toolButton.setEnabled(True)
 
 
+	@profiler.timed('edit.updateValueList')
 	def updateValueList(self, value):
 		"""Update the value list view."""
 
-		self.valueList = value.split(os.pathsep)
+		self.valueList = value.split(self.pathsep)
 
 		self.ui.valueList_listWidget.clear()
 		self.ui.valueList_listWidget.addItems(self.valueList)
@@ -147,7 +164,7 @@ class Dialog(QtWidgets.QDialog, UI.TemplateUI):
 	def updateValueLine(self):
 		"""Update the value line edit."""
 
-		valueStr = os.pathsep.join(n for n in self.valueList)
+		valueStr = self.pathsep.join(n for n in self.valueList)
 
 		# self.ui.value_lineEdit.blockSignals(True)
 		self.ui.value_lineEdit.setText(valueStr)
@@ -296,6 +313,23 @@ class Dialog(QtWidgets.QDialog, UI.TemplateUI):
 			return self.fileDialog(dialogHome)
 
 
+	def findReferences(self):
+		"""Show the variables which reference the selected path, or anything
+		beneath it.
+		"""
+		items = self.ui.valueList_listWidget.selectedItems()
+		if not items:
+			return
+
+		path = items[0].text()
+		keys = self.pathIndex.references(path)
+		if keys:
+			msg = "%d variable(s) reference '%s':\n\n%s" % (len(keys), path, "\n".join(keys))
+		else:
+			msg = "No variables reference '%s'." % path
+		QtWidgets.QMessageBox.information(self, "Find References", msg)
+
+
 	def ok(self):
 		"""Dialog accept function."""
 
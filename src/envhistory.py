@@ -0,0 +1,137 @@
+# envhistory.py
+#
+# Mike Bonnington <mjbonnington@gmail.com>
+# (c) 2018-2022
+#
+# Environment History
+#
+# A timeline of the process environment, recorded at each reload, each save
+# and periodically. Only the most recent snapshot is held in full (as a
+# CompactEnviron sharing its stored values with the live store); every older
+# snapshot is held as a reverse delta of the variables which changed, i.e.
+# their values before the change. Deltas are kept in a ring buffer bounded by
+# both count and memory, the oldest being dropped first. Any snapshot still in
+# the buffer can be rebuilt by replaying deltas backwards from the newest, and
+# the history of a single variable can be read from the deltas alone.
+#
+# Deltas hold plain strings rather than stored forms, so they share nothing
+# with the PathPool and the memory bound is exact: dropping a snapshot frees
+# everything it held. The head shares the pool with the live store; its
+# pieces are released by the pool's pruning once the head moves on.
+
+
+import collections
+import sys
+import time
+
+# Import custom modules
+import envstore
+
+
+HISTORY_LENGTH = 500  # Maximum number of snapshots kept
+HISTORY_MEMORY = 4*1024*1024  # Maximum memory used by deltas, in bytes
+
+
+class Snapshot(object):
+	"""A point on the timeline. 'delta' maps each variable which changed at
+	this point to its value before the change, or None if the variable was
+	added.
+	"""
+	__slots__ = ('time', 'label', 'delta', 'size')
+
+	def __init__(self, label, delta):
+		self.time = time.time()
+		self.label = label
+		self.delta = delta
+		self.size = sys.getsizeof(delta) + sum(
+			sys.getsizeof(key) + sys.getsizeof(value)
+			for key, value in delta.items())
+
+
+class HistoryBuffer(object):
+	"""Bounded timeline of delta-compressed environment snapshots."""
+
+	def __init__(self, length=HISTORY_LENGTH, memory=HISTORY_MEMORY):
+		self.length = length
+		self.memory = memory
+		self.head = None  # The newest snapshot, in full
+		self.snapshots = collections.deque()  # Oldest first
+		self.size = 0  # Memory used by deltas, in bytes
+		self.dropped = 0  # Number of snapshots dropped from the buffer
+
+
+	def __len__(self):
+		return len(self.snapshots)
+
+
+	def record(self, environ, label):
+		"""Record a snapshot of the environment, a CompactEnviron. Return
+		the new snapshot, or None if nothing has changed since the last one.
+		"""
+		if self.head is None:
+			snapshot = Snapshot(label, {})
+		else:
+			added, removed, modified = environ.diff(self.head)
+			if not (added or removed or modified):
+				return None
+			delta = dict.fromkeys(added)
+			for key in removed + modified:
+				delta[key] = self.head[key]
+			snapshot = Snapshot(label, delta)
+
+		self.snapshots.append(snapshot)
+		self.size += snapshot.size
+		self.head = environ.copy()
+
+		# Drop the oldest snapshots to stay within bounds, always keeping
+		# the newest
+		while len(self.snapshots) > 1 and (
+		 len(self.snapshots) > self.length or self.size > self.memory):
+			self.size -= self.snapshots.popleft().size
+			self.dropped += 1
+
+		return snapshot
+
+
+	def restore(self, index):
+		"""Return the snapshot at the given index (0 is the oldest in the
+		buffer) as a new CompactEnviron, by replaying deltas backwards from
+		the newest snapshot.
+		"""
+		environ = self.head.copy()
+		for i in range(len(self.snapshots)-1, index, -1):
+			for key, value in self.snapshots[i].delta.items():
+				if value is None:
+					del environ[key]
+				else:
+					environ[key] = value
+		return environ
+
+
+	def keyHistory(self, key):
+		"""Return a list of the changes to a single variable, newest first,
+		as tuples of (index, snapshot, old value, new value). Values are None
+		where the variable did not exist. Only the deltas are visited.
+		"""
+		history = []
+		if self.head is None:
+			return history
+		value = self.head.get(key)
+		key = self.head.canonicalKey(key) or key
+
+		for i in range(len(self.snapshots)-1, -1, -1):
+			snapshot = self.snapshots[i]
+			if key not in snapshot.delta:
+				continue
+			old = snapshot.delta[key]
+			history.append((i, snapshot, old, value))
+			value = old
+		return history
+
+
+	def usage(self):
+		"""Return a short description of the memory used by the buffer."""
+
+		return "%d snapshot(s), %s of %s used by deltas" % (
+			len(self.snapshots), envstore.formatBytes(self.size),
+			envstore.formatBytes(self.memory))
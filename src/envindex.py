@@ -0,0 +1,343 @@
+# envindex.py
+#
+# Mike Bonnington <mjbonnington@gmail.com>
+# (c) 2018-2022
+#
+# Environment Indices
+#
+# Indices computed once per reload over the environment and kept up to date
+# as individual variables are edited, so that the browser never has to
+# rescan every value to answer structural questions.
+
+
+import collections
+import os
+import re
+
+# Import custom modules
+import envsize
+
+
+# Grouping modes, matching the items in grouping_comboBox
+GROUP_NONE = 0
+GROUP_PREFIX = 1
+GROUP_REZ_PACKAGE = 2
+
+# Rez package variables, e.g. REZ_USD_ROOT, REZ_USD_MAJOR_VERSION
+REZ_PACKAGE_VAR = re.compile(r'^REZ_(.+?)_(ROOT|BASE|VERSION|MAJOR_VERSION|MINOR_VERSION|PATCH_VERSION)$')
+
+
+class GroupIndex(object):
+	"""Index of the group each environment variable belongs to.
+
+	In prefix mode variables are grouped by the part of the key before the
+	first underscore, so 'OCIO' and 'OCIO_ACTIVE_VIEWS' share the group
+	'OCIO'. In rez package mode variables are grouped by the rez package
+	whose REZ_<PKG>_* variables define them, or whose root directory one of
+	their path elements lives under. Groups with a single member are not
+	shown as groups.
+	"""
+	def __init__(self, mode=GROUP_NONE, pathsep=os.pathsep):
+		self.mode = mode
+		self.pathsep = pathsep
+		self.groupOf = {}
+		self.sizes = collections.Counter()
+		self.packageRoots = {}
+		self.packageNames = set()
+
+
+	def rebuild(self, environ):
+		"""Rebuild the index from scratch."""
+
+		self.groupOf.clear()
+		self.sizes.clear()
+		self.packageRoots = {}
+		self.packageNames = set()
+
+		if self.mode == GROUP_NONE:
+			return
+
+		if self.mode == GROUP_REZ_PACKAGE:
+			for key in environ:
+				match = REZ_PACKAGE_VAR.match(key)
+				if match and match.group(2) == 'ROOT':
+					root = environ[key].rstrip('/\\')
+					self.packageRoots[root] = match.group(1).lower()
+			self.packageNames = set(self.packageRoots.values())
+
+		for key in environ:
+			self._add(key, environ)
+
+
+	def update(self, environ, key):
+		"""Update the index after the variable 'key' has been added or
+		modified.
+		"""
+		if self.mode == GROUP_REZ_PACKAGE and key.startswith('REZ_') and key.endswith('_ROOT'):
+			self.rebuild(environ)  # Package roots changed
+			return
+
+		self.remove(key)
+		self._add(key, environ)
+
+
+	def remove(self, key):
+		"""Update the index after the variable 'key' has been removed."""
+
+		group = self.groupOf.pop(key, None)
+		if group is not None:
+			self.sizes[group] -= 1
+
+
+	def group(self, key):
+		"""Return the name of the group for key, or None if it should not be
+		shown in a group.
+		"""
+		group = self.groupOf.get(key)
+		if group is not None and self.sizes[group] > 1:
+			return group
+		return None
+
+
+	def _add(self, key, environ):
+		"""Compute and store the group for a single key."""
+
+		if self.mode == GROUP_PREFIX:
+			group = key.split('_', 1)[0] or None
+		elif self.mode == GROUP_REZ_PACKAGE:
+			group = self._rezPackage(key, environ[key])
+		else:
+			group = None
+
+		if group is not None:
+			self.groupOf[key] = group
+			self.sizes[group] += 1
+
+
+	def _rezPackage(self, key, value):
+		"""Return the name of the rez package the variable belongs to."""
+
+		match = REZ_PACKAGE_VAR.match(key)
+		if match and match.group(1).lower() in self.packageNames:
+			return match.group(1).lower()
+
+		if not self.packageRoots:
+			return None
+
+		dirname = envsize.pathModule(self.pathsep).dirname
+		for element in value.split(self.pathsep):
+			path = element.rstrip('/\\')
+			while path:
+				package = self.packageRoots.get(path)
+				if package is not None:
+					return package
+				parent = dirname(path)
+				if parent == path:
+					break
+				path = parent
+
+		return None
+
+
+# Change statuses
+ADDED = 'added'
+MODIFIED = 'modified'
+REMOVED = 'removed'
+
+
+class ChangeTracker(object):
+	"""Tracks which variables differ from a baseline environment (the live
+	os.environ at the time of the last reload or save).
+
+	The status of each variable is kept in a dictionary and updated per edit,
+	so looking up whether a row is added, modified or removed is O(1) and no
+	full diff is ever needed.
+	"""
+	def __init__(self):
+		self.baseline = {}
+		self.status = {}
+
+
+	def reset(self, baseline):
+		"""Set a new baseline and clear all statuses."""
+
+		self.baseline = baseline
+		self.status = {}
+
+
+	def update(self, environ, key):
+		"""Update the status after the variable 'key' has been added or
+		modified. In a case-insensitive environment any status held under
+		another spelling of the key is dropped.
+		"""
+		if not getattr(environ, 'caseSensitive', True):
+			folded = key.upper()
+			for spelling in [k for k in self.status if k != key and k.upper() == folded]:
+				del self.status[spelling]
+
+		if key not in self.baseline:
+			self.status[key] = ADDED
+		elif self.baseline[key] != environ[key]:
+			self.status[key] = MODIFIED
+		else:
+			self.status.pop(key, None)
+
+
+	def remove(self, key):
+		"""Update the status after the variable 'key' has been removed."""
+
+		if key in self.baseline:
+			self.status[key] = REMOVED
+		else:
+			self.status.pop(key, None)
+
+
+	def removedKeys(self):
+		"""Return a list of the keys which have been removed."""
+
+		return [key for key, status in self.status.items() if status == REMOVED]
+
+
+	def __len__(self):
+		return len(self.status)
+
+
+# Sort modes, matching the items in sortMode_comboBox
+SORT_KEY = 0
+SORT_NATURAL = 1
+SORT_SIZE = 2
+SORT_PATH_COUNT = 3
+SORT_STATUS = 4
+
+# Modes which list the largest values first
+SORT_DESCENDING = (SORT_SIZE, SORT_PATH_COUNT)
+
+STATUS_RANK = {ADDED: '0', MODIFIED: '1', REMOVED: '2', None: '3'}
+
+NUMBER = re.compile(r'\d+')
+
+
+class SortKeyIndex(object):
+	"""Cache of sort keys for every variable.
+
+	Sort keys are measured once per reload and per edit, and encoded as
+	strings so that the list view can sort on them natively. Switching sort
+	mode is then a single reorder that never looks at the values again.
+	Entries for removed variables are kept so that their (greyed out) rows
+	still sort by their last value.
+	"""
+	def __init__(self, pathsep=os.pathsep):
+		self.pathsep = pathsep
+		self.natural = {}
+		self.sizes = {}
+		self.pathCounts = {}
+
+
+	def rebuild(self, environ):
+		"""Measure every variable."""
+
+		self.natural.clear()
+		self.sizes.clear()
+		self.pathCounts.clear()
+		for key, value in environ.items():
+			self._add(key, value)
+
+
+	def update(self, environ, key):
+		"""Measure the variable 'key' after it has been added or modified."""
+
+		self._add(key, environ[key])
+
+
+	def _add(self, key, value):
+		self.natural[key] = NUMBER.sub(lambda m: m.group().zfill(20), key.lower())
+		self.sizes[key] = len(value.encode('utf-8', 'surrogateescape'))
+		self.pathCounts[key] = value.count(self.pathsep) + 1 if value else 0
+
+
+	def sortKey(self, mode, key, status=None):
+		"""Return the sort key string for a variable. Keys are appended so
+		that ties are broken in key order.
+		"""
+		if mode == SORT_NATURAL:
+			return "%s\0%s" % (self.natural.get(key, key), key)
+		if mode == SORT_SIZE:
+			return "%012d\0%s" % (self.sizes.get(key, 0), key)
+		if mode == SORT_PATH_COUNT:
+			return "%08d\0%s" % (self.pathCounts.get(key, 0), key)
+		if mode == SORT_STATUS:
+			return "%s\0%s" % (STATUS_RANK[status], key)
+		return key
+
+
+class PathIndex(object):
+	"""Inverted index from paths to the variables which reference them.
+
+	Every absolute path element of every value is indexed, along with each of
+	its parent directories, so asking which variables reference a package
+	root also finds variables pointing at files or subdirectories inside it.
+	"""
+	def __init__(self, pathsep=os.pathsep):
+		self.pathsep = pathsep
+		self.refs = collections.defaultdict(set)  # path -> keys
+		self.keyPaths = {}  # key -> paths indexed for it
+
+
+	def rebuild(self, environ):
+		"""Rebuild the index from scratch."""
+
+		self.refs.clear()
+		self.keyPaths.clear()
+		for key, value in environ.items():
+			self._add(key, value)
+
+
+	def update(self, environ, key):
+		"""Update the index after the variable 'key' has been added or
+		modified.
+		"""
+		self.remove(key)
+		self._add(key, environ[key])
+
+
+	def remove(self, key):
+		"""Update the index after the variable 'key' has been removed."""
+
+		for path in self.keyPaths.pop(key, ()):
+			keys = self.refs[path]
+			keys.discard(key)
+			if not keys:
+				del self.refs[path]
+
+
+	def references(self, path):
+		"""Return a sorted list of the keys referencing the given path or
+		anything beneath it.
+		"""
+		return sorted(self.refs.get(self.normalise(path), ()))
+
+
+	def normalise(self, path):
+		"""Return the path in the form used as an index key."""
+
+		return path.rstrip('/\\') or path
+
+
+	def _add(self, key, value):
+		pathModule = envsize.pathModule(self.pathsep)
+		paths = set()
+		for element in value.split(self.pathsep):
+			if not pathModule.isabs(element):
+				continue
+			path = self.normalise(element)
+			while path not in paths:
+				paths.add(path)
+				parent = pathModule.dirname(path)
+				if parent == path:
+					break
+				path = parent
+
+		if paths:
+			self.keyPaths[key] = paths
+			for path in paths:
+				self.refs[path].add(key)
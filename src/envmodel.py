@@ -0,0 +1,166 @@
+# envmodel.py
+#
+# Mike Bonnington <mjbonnington@gmail.com>
+# (c) 2018-2022
+#
+# Shared Environment Model
+#
+# A single, versioned environment store per process, together with the
+# indices which don't depend on how it is viewed (block sizes, sort keys,
+# path references and pending changes). Any number of browser panels can
+# show the same model; each one only holds its own view state (filter,
+# grouping, sort mode). Changes made through one panel are applied once to
+# the model and fanned out to all the others, so memory and refresh cost do
+# not grow with the number of open panels.
+
+
+import os
+import time
+import weakref
+
+# Import custom modules
+import envhistory
+import envindex
+import envsize
+import envstore
+
+
+class EnvironmentModel(object):
+	"""Shared environment store with indices and change notification."""
+
+	def __init__(self):
+		self.environ = envstore.CompactEnviron()
+		self.sizeAnalyzer = envsize.BlockSizeAnalyzer()
+		self.sortKeys = envindex.SortKeyIndex()
+		self.pathIndex = envindex.PathIndex()
+		self.changes = envindex.ChangeTracker()
+		self.history = envhistory.HistoryBuffer()
+		self.loaded = False
+		self.live = False  # True if the environment was read from os.environ
+		self._lastSample = 0
+		self._listeners = []
+
+
+	def subscribe(self, callback):
+		"""Register a bound method to be called when the model changes.
+
+		The callback is called as callback(changed, removed, reset, source).
+		Only a weak reference is held, so views which have been deleted are
+		dropped automatically.
+		"""
+		self._listeners.append(weakref.WeakMethod(callback))
+
+
+	def unsubscribe(self, callback):
+		"""Unregister a callback."""
+
+		self._listeners = [ref for ref in self._listeners
+		                   if ref() is not None and ref() != callback]
+
+
+	def notify(self, changed=(), removed=(), reset=False, source=None):
+		"""Call all registered callbacks."""
+
+		alive = []
+		for ref in self._listeners:
+			callback = ref()
+			if callback is not None:
+				alive.append(ref)
+				callback(changed, removed, reset, source)
+		self._listeners = alive
+
+
+	def reload(self, environ=None, source=None):
+		"""Replace the environment, by default with a copy of os.environ, and
+		rebuild all indices. Reading os.environ records a history snapshot.
+		"""
+		self.live = environ is None
+		if self.live:
+			environ = envstore.CompactEnviron(os.environ)
+			self.history.record(environ, "Reload")
+		self.environ = environ
+		self.loaded = True
+
+		for index in (self.sizeAnalyzer, self.sortKeys, self.pathIndex):
+			index.pathsep = environ.pathsep
+		self.sizeAnalyzer.rebuild(environ)
+		self.sortKeys.rebuild(environ)
+		self.pathIndex.rebuild(environ)
+		self.changes.reset(environ.copy())
+
+		self.notify(reset=True, source=source)
+
+
+	def apply(self, changed=(), removed=(), source=None):
+		"""Update all indices after the variables in 'changed' have been
+		added or modified and the variables in 'removed' have been removed
+		from the environment, then notify the views.
+
+		Changed keys are indexed under the spelling they are stored under.
+		Removals are applied first, so a key renamed to a different case is
+		removed under its old spelling and indexed under its new one.
+		"""
+		changed = [self.environ.canonicalKey(key) or key for key in changed]
+		removed = list(removed)
+		for key in removed:
+			self.sizeAnalyzer.remove(key)
+			self.pathIndex.remove(key)
+			self.changes.remove(key)
+		for key in changed:
+			self.sizeAnalyzer.update(self.environ, key)
+			self.sortKeys.update(self.environ, key)
+			self.pathIndex.update(self.environ, key)
+			self.changes.update(self.environ, key)
+
+		self.notify(changed, removed, source=source)
+
+
+	def save(self, source=None):
+		"""Write the environment to os.environ. The saved environment
+		becomes the new baseline for pending changes.
+
+		If the environment was read from os.environ only the pending changes
+		are written, otherwise (e.g. a snapshot was loaded) existing
+		environment variables are cleared first. Values hold undecodable
+		bytes as surrogate escapes, so they are written back byte-exact.
+		"""
+		if self.live:
+			for key, status in self.changes.status.items():
+				if status == envindex.REMOVED:
+					os.environ.pop(key, None)
+				else:
+					os.environ[key] = self.environ[key]
+		else:
+			# os.environ = dict(self.environ) # this doesn't actually set the env vars
+			os.environ.clear()
+			for key in self.environ.keys():
+				os.environ[key] = self.environ[key]
+			self.live = True
+
+		self.history.record(self.environ, "Save")
+		self.changes.reset(self.environ.copy())
+		self.notify(reset=True, source=source)
+
+
+	def sample(self, interval):
+		"""Record a history snapshot of os.environ if it has changed, unless
+		it has already been sampled in the last 'interval' seconds. Called
+		periodically by every open panel, so the check keeps them from
+		sampling in turn.
+		"""
+		now = time.time()
+		if now - self._lastSample < interval:
+			return None
+		self._lastSample = now
+		return self.history.record(envstore.CompactEnviron(os.environ), "Timer")
+
+
+_sharedModel = None
+
+def sharedModel():
+	"""Return the environment model shared by all panels in this process."""
+
+	global _sharedModel
+	if _sharedModel is None:
+		_sharedModel = EnvironmentModel()
+	return _sharedModel
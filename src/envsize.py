@@ -0,0 +1,208 @@
+# envsize.py
+#
+# Mike Bonnington <mjbonnington@gmail.com>
+# (c) 2018-2022
+#
+# Environment Block Size Analyzer
+#
+# Measures how much space the environment takes up when it is passed to a
+# new process, and how that compares with the system limit. Exceeding the
+# limit is what causes "Argument list too long" errors when launching jobs
+# from huge rez environments. Sizes are computed in one pass on reload and
+# updated per variable after edits.
+
+
+import heapq
+import ntpath
+import os
+import posixpath
+import struct
+import sys
+
+
+POINTER_SIZE = struct.calcsize('P')
+
+# Linux limits the length of any single "KEY=value" string to 32 pages
+MAX_ARG_STRLEN = 32 * 4096
+
+# Windows limits the environment block to 32767 characters
+WINDOWS_ENV_LIMIT = 32767
+
+
+def systemLimit():
+	"""Return the maximum size in bytes of the arguments and environment
+	passed to a new process, or None if it cannot be determined.
+	"""
+	if sys.platform == 'win32':
+		return WINDOWS_ENV_LIMIT
+	try:
+		limit = os.sysconf('SC_ARG_MAX')
+		if limit > 0:
+			return limit
+	except (AttributeError, ValueError, OSError):
+		pass
+	return None
+
+
+def entrySize(key, value):
+	"""Return the number of bytes the variable occupies in the environment
+	block: the 'KEY=value' string, its terminating null and the pointer to
+	it in the envp array.
+	"""
+	if sys.platform == 'win32':
+		return len(key) + len(value) + 2  # Characters, not bytes
+	encoding = sys.getfilesystemencoding()
+	return len(key.encode(encoding, 'surrogateescape')) \
+	     + len(value.encode(encoding, 'surrogateescape')) + 2 + POINTER_SIZE
+
+
+def pathModule(pathsep=os.pathsep):
+	"""Return the os.path module for the platform whose path separator is
+	'pathsep', so that snapshots from Windows can be handled on Linux and
+	vice versa.
+	"""
+	return ntpath if pathsep == ';' else posixpath
+
+
+def duplicateBytes(value, pathsep=os.pathsep):
+	"""Return the number of bytes wasted on repeated path elements. Empty
+	elements are not counted, as they are meaningful (e.g. the current
+	directory in PATH).
+	"""
+	if pathsep not in value:
+		return 0
+
+	seen = set()
+	wasted = 0
+	for element in value.split(pathsep):
+		if not element:
+			continue
+		if element in seen:
+			wasted += len(element) + 1
+		else:
+			seen.add(element)
+	return wasted
+
+
+def isPathList(value, pathsep=os.pathsep):
+	"""Return True if the value looks like a list of absolute paths.
+
+	Values such as URLs also contain os.pathsep on Linux, so they must not
+	be treated as path lists.
+	"""
+	if pathsep not in value:
+		return False
+	isabs = pathModule(pathsep).isabs
+	elements = [e for e in value.split(pathsep) if e]
+	return bool(elements) and all(isabs(e) for e in elements)
+
+
+def compactValue(value, pathsep=os.pathsep, removeMissing=True):
+	"""Return the value with duplicate and (optionally) nonexistent path
+	elements removed, keeping the first occurrence of each element.
+
+	Empty elements are kept, as they are meaningful: the current directory
+	in PATH, or the system default in MANPATH. Existence can only be checked
+	for paths on this platform, so 'removeMissing' is ignored for snapshots
+	using another platform's path separator.
+	"""
+	checkExists = removeMissing and pathsep == os.pathsep
+	seen = set()
+	elements = []
+	for element in value.split(pathsep):
+		if element:
+			if element in seen:
+				continue
+			seen.add(element)
+			if checkExists and not os.path.exists(element):
+				continue
+		elements.append(element)
+	return pathsep.join(elements)
+
+
+def compactEnviron(environ, removeMissing=True, pathsep=os.pathsep):
+	"""Compact every path-list variable in the environment.
+
+	Return a dictionary mapping each key whose value would change to its new
+	value. 'environ' is not modified.
+	"""
+	replacements = {}
+	for key, value in environ.items():
+		if isPathList(value, pathsep):
+			newValue = compactValue(value, pathsep, removeMissing)
+			if newValue != value:
+				replacements[key] = newValue
+	return replacements
+
+
+class BlockSizeAnalyzer(object):
+	"""Running totals of the environment block size."""
+
+	def __init__(self, pathsep=os.pathsep):
+		self.pathsep = pathsep
+		self.limit = systemLimit()
+		self.sizes = {}
+		self.duplicates = {}
+		self.total = 0
+		self.totalDuplicates = 0
+
+
+	def rebuild(self, environ):
+		"""Recompute all sizes in a single pass over the environment."""
+
+		self.sizes.clear()
+		self.duplicates.clear()
+		self.total = 0
+		self.totalDuplicates = 0
+		for key, value in environ.items():
+			self._add(key, value)
+
+
+	def update(self, environ, key):
+		"""Update totals after the variable 'key' has been added or
+		modified.
+		"""
+		self.remove(key)
+		self._add(key, environ[key])
+
+
+	def remove(self, key):
+		"""Update totals after the variable 'key' has been removed."""
+
+		self.total -= self.sizes.pop(key, 0)
+		self.totalDuplicates -= self.duplicates.pop(key, 0)
+
+
+	def _add(self, key, value):
+		size = entrySize(key, value)
+		self.sizes[key] = size
+		self.total += size
+		wasted = duplicateBytes(value, self.pathsep)
+		if wasted:
+			self.duplicates[key] = wasted
+			self.totalDuplicates += wasted
+
+
+	def largest(self, count=20):
+		"""Return a list of (key, size) tuples for the largest variables."""
+
+		return heapq.nlargest(count, self.sizes.items(), key=lambda item: item[1])
+
+
+	def oversized(self):
+		"""Return a list of keys whose 'KEY=value' string is too long to be
+		passed to a new process on Linux, regardless of the total size.
+		"""
+		if not sys.platform.startswith('linux'):
+			return []
+		return [key for key, size in self.sizes.items()
+		        if size - POINTER_SIZE > MAX_ARG_STRLEN]
+
+
+	def usage(self):
+		"""Return the fraction of the system limit used, or None if the limit
+		is unknown.
+		"""
+		if not self.limit:
+			return None
+		return float(self.total) / self.limit
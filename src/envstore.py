@@ -0,0 +1,508 @@
+# envstore.py
+#
+# Mike Bonnington <mjbonnington@gmail.com>
+# (c) 2018-2022
+#
+# Compact Environment Store
+#
+# A dictionary-like container for environment variables which stores
+# path-list values (e.g. PATH, PYTHONPATH, LD_LIBRARY_PATH) as tuples of
+# pooled pieces instead of full strings. Each path element is held as its
+# parent directory and its final component, both shared by every store in
+# the process, so a package root such as
+# '/mnt/pipeline/rez/packages/usd/22.11/' is only held in memory once no
+# matter how many variables, snapshots or diffs refer to it. Values are
+# materialised back into strings, with a single join, only when they are
+# read.
+
+
+import io
+import json
+import os
+import re
+import shlex
+import sys
+import weakref
+
+try:
+	from collections.abc import MutableMapping
+except ImportError:  # Python 2
+	from collections import MutableMapping
+
+# Import custom modules
+import envsize
+
+
+class PathPool(object):
+	"""Pool of the pieces path-list values are stored as.
+
+	Pieces are plain strings, held once however many stores refer to them.
+	The pool is not sys.intern(), as interned strings are never freed on
+	some Python versions; instead pieces which no store refers to any more
+	are dropped whenever the pool has doubled in size since it was last
+	pruned, so its size stays bounded by what live stores use.
+	"""
+	MIN_PRUNE_SIZE = 4096
+
+	def __init__(self):
+		self._pieces = {}
+		self._stores = weakref.WeakValueDictionary()  # id -> store
+		self._pruneSize = self.MIN_PRUNE_SIZE
+
+
+	def __len__(self):
+		return len(self._pieces)
+
+
+	def register(self, store):
+		"""Register a store, so that the pieces it uses survive pruning."""
+
+		self._stores[id(store)] = store
+
+
+	def pack(self, value, pathsep):
+		"""Return the stored form of a path-list value: a tuple of pooled
+		pieces which join to form the value. Each element is split after its
+		last directory separator, and the path separator which follows it is
+		kept with its final component, so e.g. 'bin:' is shared by every
+		element of PATH.
+		"""
+		if len(self._pieces) > self._pruneSize:
+			self.prune()
+
+		intern = self._pieces.setdefault
+		windows = pathsep == ';'
+		stored = []
+		for element in value.split(pathsep):
+			split = element.rfind('/')
+			if windows:
+				split = max(split, element.rfind('\\'))
+			parent = element[:split+1]
+			name = element[split+1:] + pathsep
+			stored.append(intern(parent, parent))
+			stored.append(intern(name, name))
+		name = stored.pop()[:-len(pathsep)]
+		stored.append(intern(name, name))
+		return tuple(stored)
+
+
+	def prune(self):
+		"""Drop the pieces no registered store refers to."""
+
+		pieces = {}
+		for store in list(self._stores.values()):
+			for stored in store._data.values():
+				if isinstance(stored, tuple):
+					for piece in stored:
+						pieces.setdefault(piece, piece)
+		self._pieces = pieces
+		self._pruneSize = max(self.MIN_PRUNE_SIZE, 2*len(pieces))
+
+
+	def memoryUsage(self):
+		"""Return the memory used by the pool's own table, in bytes. The
+		pieces are counted by the stores using them.
+		"""
+		return sys.getsizeof(self._pieces)
+
+
+# Pool shared by all stores in the process
+sharedPool = PathPool()
+
+
+class CompactEnviron(MutableMapping):
+	"""Dictionary of environment variables with compact storage for values
+	containing lists of paths.
+
+	Keys may be case-sensitive (POSIX) or case-insensitive (Windows). In
+	case-insensitive mode a folded key index maps the upper-cased form of
+	each key to the spelling it is stored under, so lookups, duplicate
+	detection and diffs remain O(1) per key. Setting an existing variable
+	under a different case keeps its original spelling, as Windows does.
+	"""
+	def __init__(self, data=None, pool=None, pathsep=os.pathsep, caseSensitive=None):
+		if caseSensitive is None:
+			caseSensitive = os.name != 'nt'
+		self.pool = sharedPool if pool is None else pool
+		self.pool.register(self)
+		self.pathsep = pathsep
+		self.caseSensitive = caseSensitive
+		self._data = {}
+		self._folded = None if caseSensitive else {}  # KEY -> stored key
+		self._memoryUsage = None  # Cached, invalidated on change
+		self.version = 0  # Incremented on every change
+		if data is not None:
+			self.update(data)
+
+
+	def _pack(self, value):
+		"""Return the stored representation of a value string."""
+
+		if envsize.isPathList(value, self.pathsep):
+			return self.pool.pack(value, self.pathsep)
+		return value
+
+
+	def _unpack(self, stored):
+		"""Return the value string for a stored representation."""
+
+		if isinstance(stored, tuple):
+			return "".join(stored)
+		return stored
+
+
+	def canonicalKey(self, key):
+		"""Return the spelling the key is stored under, or None if it is not
+		present.
+		"""
+		if self._folded is None:
+			return key if key in self._data else None
+		return self._folded.get(key.upper())
+
+
+	def _storedKey(self, key):
+		"""Return the spelling to store the key under."""
+
+		if self._folded is None:
+			return key
+		return self._folded.get(key.upper(), key)
+
+
+	def __getitem__(self, key):
+		return self._unpack(self._data[self._storedKey(key)])
+
+
+	def __setitem__(self, key, value):
+		key = self._storedKey(key)
+		self._data[key] = self._pack(value)
+		if self._folded is not None:
+			self._folded[key.upper()] = key
+		self._memoryUsage = None
+		self.version += 1
+
+
+	def __delitem__(self, key):
+		key = self._storedKey(key)
+		del self._data[key]
+		if self._folded is not None:
+			del self._folded[key.upper()]
+		self._memoryUsage = None
+		self.version += 1
+
+
+	def __iter__(self):
+		return iter(self._data)
+
+
+	def __len__(self):
+		return len(self._data)
+
+
+	def __contains__(self, key):
+		if self._folded is None:
+			return key in self._data
+		return key.upper() in self._folded
+
+
+	def __repr__(self):
+		return "%s(%r)" % (self.__class__.__name__, dict(self.items()))
+
+
+	def copy(self):
+		"""Return a shallow copy sharing the same pool."""
+
+		other = self.__class__(pool=self.pool, pathsep=self.pathsep, caseSensitive=self.caseSensitive)
+		other._data = dict(self._data)
+		if self._folded is not None:
+			other._folded = dict(self._folded)
+		return other
+
+
+	def renameKeys(self, renames):
+		"""Rename keys in a single batch. 'renames' maps old keys to new
+		keys. Stored values are moved without being materialised, and chains
+		such as A -> B, B -> C are handled. Raise ValueError, leaving the store
+		unchanged, if a new key would overwrite a variable which is not being
+		renamed, or two keys would be renamed to the same key.
+		"""
+		fold = (lambda key: key) if self._folded is None else (lambda key: key.upper())
+		renamed = set(fold(self._storedKey(key)) for key in renames)
+		targets = set()
+		for newKey in renames.values():
+			if fold(newKey) in targets:
+				raise ValueError("More than one variable would be renamed to '%s'." % newKey)
+			targets.add(fold(newKey))
+			existing = self.canonicalKey(newKey)
+			if existing is not None and fold(existing) not in renamed:
+				raise ValueError("'%s' already exists." % existing)
+
+		stored = {}
+		for key in renames:
+			oldKey = self._storedKey(key)
+			stored[key] = self._data.pop(oldKey)
+			if self._folded is not None:
+				del self._folded[oldKey.upper()]
+		for key, newKey in renames.items():
+			self._data[newKey] = stored[key]
+			if self._folded is not None:
+				self._folded[newKey.upper()] = newKey
+		self._memoryUsage = None
+		self.version += 1
+
+
+	def diff(self, other):
+		"""Compare with another environment, taken to be the older of the
+		two. Return a tuple of lists of the keys which have been added,
+		removed and modified.
+
+		Keys are matched using this environment's key semantics. Values
+		stored with the same path separator are compared without being
+		materialised.
+		"""
+		added = []
+		modified = []
+		samePacking = isinstance(other, CompactEnviron) and other.pathsep == self.pathsep
+		for key, stored in self._data.items():
+			if key not in other:
+				added.append(key)
+			elif samePacking:
+				if other._data[other._storedKey(key)] != stored:
+					modified.append(key)
+			elif other[key] != self._unpack(stored):
+				modified.append(key)
+		removed = [key for key in other if key not in self]
+		return added, removed, modified
+
+
+	def isPathList(self, key):
+		"""Return True if the value for key is stored as a list of paths."""
+
+		return isinstance(self._data[self._storedKey(key)], tuple)
+
+
+	def memoryUsage(self):
+		"""Return a tuple containing the approximate memory used by this
+		store (including the shared pool's table, and each piece it uses
+		counted once) and the memory the same data would use as a plain
+		dictionary of strings, both in bytes.
+		"""
+		if self._memoryUsage is not None:
+			return self._memoryUsage
+
+		compact = sys.getsizeof(self._data) + self.pool.memoryUsage()
+		raw = sys.getsizeof(self._data)
+		pieces = {}  # id -> piece
+		for key, stored in self._data.items():
+			compact += sys.getsizeof(key) + sys.getsizeof(stored)
+			raw += sys.getsizeof(key) + sys.getsizeof(self._unpack(stored))
+			if isinstance(stored, tuple):
+				for piece in stored:
+					pieces[id(piece)] = piece
+		compact += sum(sys.getsizeof(piece) for piece in pieces.values())
+		self._memoryUsage = compact, raw
+		return self._memoryUsage
+
+
+# Bytes which are not valid in the file system encoding are decoded by
+# os.environ to lone surrogates ('surrogateescape'), which encode back to the
+# original bytes exactly. Qt strings can't hold lone surrogates, so values
+# containing them are shown and edited with the bytes as \xNN escapes and
+# backslashes doubled. Only displayed values are converted, and only text
+# which came from displayValue is converted back.
+_RAW_BYTE = re.compile(u'[\udc80-\udcff]')
+_DISPLAY_ESCAPE = re.compile(u'[\\\\\udc80-\udcff]')
+_STORED_ESCAPE = re.compile(r'\\(\\|x[89a-fA-F][0-9a-fA-F])')
+_ANSI_ESCAPE = re.compile(r'\\(x[0-9a-fA-F]{1,2}|.)', re.DOTALL)
+_ANSI_CHARS = {'n': '\n', 'r': '\r', 't': '\t'}
+
+
+def hasRawBytes(value):
+	"""Return True if the value contains undecodable bytes."""
+
+	return _RAW_BYTE.search(value) is not None
+
+
+def _displayEscape(match):
+	char = match.group()
+	if char == '\\':
+		return '\\\\'
+	return '\\x%02x' % (ord(char) - 0xdc00)
+
+
+def displayValue(value):
+	"""Return the value for display. If it contains undecodable bytes they
+	are shown as \\xNN escapes and backslashes are doubled; other values are
+	returned unchanged.
+	"""
+	if not hasRawBytes(value):
+		return value
+	return _DISPLAY_ESCAPE.sub(_displayEscape, value)
+
+
+def _storedEscape(match):
+	escape = match.group(1)
+	if escape == '\\':
+		return '\\'
+	return chr(0xdc00 + int(escape[1:], 16))
+
+
+def storedValue(text):
+	"""Return the value for text returned by displayValue for a value
+	containing undecodable bytes, and possibly edited since; its inverse.
+	Must not be used on other text, where backslashes are literal.
+	"""
+	return _STORED_ESCAPE.sub(_storedEscape, text)
+
+
+def _ansiQuote(value):
+	"""Quote a value containing undecodable bytes as $'...', as understood
+	by bash, with the bytes as \\xNN escapes.
+	"""
+	chars = []
+	for char in value:
+		code = ord(char)
+		if 0xdc80 <= code <= 0xdcff:
+			chars.append('\\x%02x' % (code - 0xdc00))
+		elif char in ('\\', "'"):
+			chars.append('\\' + char)
+		elif char in ('\n', '\r', '\t'):
+			chars.append(repr(char)[1:-1])
+		else:
+			chars.append(char)
+	return "$'" + "".join(chars) + "'"
+
+
+def _ansiEscape(match):
+	escape = match.group(1)
+	if escape[0] == 'x' and len(escape) > 1:
+		code = int(escape[1:], 16)
+		return chr(code if code < 0x80 else 0xdc00 + code)
+	return _ANSI_CHARS.get(escape, escape)
+
+
+def _ansiUnquote(body):
+	"""Return the value for the body of a $'...' quoted value."""
+
+	return _ANSI_ESCAPE.sub(_ansiEscape, body)
+
+
+# Formats for copying variables as text
+FORMAT_KEY_VALUE = 'key=value'
+FORMAT_SHELL = 'shell'
+FORMAT_JSON = 'json'
+
+try:
+	_quote = shlex.quote
+except AttributeError:  # Python 2
+	import pipes
+	_quote = pipes.quote
+
+
+def formatEnviron(items, format=FORMAT_KEY_VALUE):
+	"""Return (key, value) pairs as text in the given format, which can be
+	read back by parseSnapshot. In KEY=VALUE format, values which span
+	several lines or start with a quote are shell-quoted. Values containing
+	undecodable bytes are quoted as $'...' with the bytes escaped, except in
+	JSON, which escapes them itself.
+	"""
+	if format == FORMAT_JSON:
+		return json.dumps(dict(items), indent=4, sort_keys=True)
+	if format == FORMAT_SHELL:
+		return "\n".join("export %s=%s" % (key, _shellQuote(value)) for key, value in items)
+	return "\n".join("%s=%s" % (key, _quoteIfNeeded(value)) for key, value in items)
+
+
+def _shellQuote(value):
+	"""Quote a value for a shell."""
+
+	if hasRawBytes(value):
+		return _ansiQuote(value)
+	return _quote(value)
+
+
+def _quoteIfNeeded(value):
+	"""Quote a value for KEY=VALUE format only if it would otherwise not be
+	read back intact.
+	"""
+	if value[:1] in ('"', "'") or value.startswith("$'") \
+	or '\n' in value or '\r' in value or hasRawBytes(value):
+		return _shellQuote(value)
+	return value
+
+
+def parseSnapshot(text):
+	"""Parse an environment snapshot and return a dictionary.
+
+	Snapshots may be a JSON object, or lines of KEY=VALUE as printed by
+	'env', 'export -p' or the Windows 'set' command. Blank lines and
+	comments are ignored, as are 'export ', 'declare -x ' and 'set '
+	prefixes. Quoted values are unquoted following shell rules and may span
+	several lines; $'...' values may contain \\xNN escapes of undecodable
+	bytes. The text is parsed in a single pass.
+	"""
+	text = text.strip()
+	if text.startswith('{'):
+		data = json.loads(text)
+		if not isinstance(data, dict) or not all(
+		 isinstance(key, str) and isinstance(value, str) for key, value in data.items()):
+			raise ValueError("JSON snapshots must map variable names to string values.")
+		return data
+
+	data = {}
+	lines = text.splitlines()
+	i = 0
+	while i < len(lines):
+		line = lines[i].strip()
+		i += 1
+		if not line or line.startswith('#'):
+			continue
+		for prefix in ('export ', 'declare -x ', 'set '):
+			if line.startswith(prefix):
+				line = line[len(prefix):]
+		key, sep, value = line.partition('=')
+		if not (sep and key):
+			continue
+
+		if value.startswith("$'") and value.endswith("'") and len(value) > 2:
+			value = _ansiUnquote(value[2:-1])
+		elif value[:1] in ('"', "'"):
+			quoted = value
+			end = i
+			while True:
+				try:
+					words = shlex.split(quoted)
+				except ValueError:  # No closing quotation
+					if end < len(lines):
+						quoted += "\n" + lines[end]
+						end += 1
+						continue
+					words = None
+				break
+			if words is not None and len(words) == 1:
+				value = words[0]
+				i = end
+
+		data[key] = value
+	return data
+
+
+def loadSnapshot(filepath, caseSensitive=None, pathsep=os.pathsep):
+	"""Load an environment snapshot file into a new CompactEnviron.
+
+	Windows snapshots can be examined on Linux by loading them with
+	caseSensitive=False and pathsep=';'.
+	"""
+	with io.open(filepath, 'r', encoding='utf-8', errors='surrogateescape') as f:
+		data = parseSnapshot(f.read())
+	return CompactEnviron(data, pathsep=pathsep, caseSensitive=caseSensitive)
+
+
+def formatBytes(size):
+	"""Return a human-readable string for a size in bytes."""
+
+	if size < 1024:
+		return "%d bytes" % size
+	for unit in ("KB", "MB", "GB"):
+		size /= 1024.0
+		if size < 1024 or unit == "GB":
+			return "%.1f %s" % (size, unit)
@@ -16,6 +16,7 @@
 # change the system environment.
 
 
+import collections
 import os
 import sys
 
@@ -23,7 +24,13 @@ from Qt import QtCore, QtGui, QtWidgets
 import ui_template as UI
 
 # Import custom modules
-import edit_envvar
+# Dialogs (edit_envvar, find_replace, block_size) are imported when first
+# used to keep startup fast
+import envindex
+import envmodel
+import envsize
+import envstore
+import profiler
 
 
 # ----------------------------------------------------------------------------
@@ -48,36 +55,67 @@ cfg = dict(
 	store_window_geometry=True, 
 )
 
+# Number of list view entries created per event loop iteration when the list
+# is populated in the background
+POPULATE_CHUNK_SIZE = 200
+
+# Hidden list view column holding the precomputed sort key
+SORT_COLUMN = 2
+
+# Item data role holding the key of a list view entry, as the text shown may
+# contain escapes
+KEY_ROLE = QtCore.Qt.UserRole + 1
+
+# Interval at which the process environment is sampled for the history, in
+# seconds
+HISTORY_INTERVAL = 60
+
+# Extra panels opened with 'New panel', kept alive until they are closed
+_panels = []
+
 # ----------------------------------------------------------------------------
 # Main dialog class
 # ----------------------------------------------------------------------------
 
 class EnvVarsDialog(QtWidgets.QDialog, UI.TemplateUI):
-	"""Environment Variables Browser dialog class."""
+	"""Environment Variables Browser dialog class.
 
-	def __init__(self, parent=None):
+	Each dialog is a view on an EnvironmentModel, by default the one shared
+	by the whole process. The dialog holds only its view state: filter,
+	grouping and sort mode.
+	"""
+	def __init__(self, parent=None, model=None, searchFilter=""):
 		super(EnvVarsDialog, self).__init__(parent)
 		self.parent = parent
+		self._startTime = profiler.now()
+		self.model = model or envmodel.sharedModel()
 
 		# UI template setup
-		self.setupUI(**cfg)
+		with profiler.span('setupUI'):
+			self.setupUI(**cfg)
 
 		# Set window icon, flags and other Qt attributes
 		self.setWindowFlags(QtCore.Qt.Dialog)
 		# self.setAttribute(QtCore.Qt.WA_DeleteOnClose, True)
 
 		# Set icons
-		self.ui.reload_toolButton.setIcon(self.iconSet('refresh.svg'))
-		self.ui.add_toolButton.setIcon(self.iconSet('add.svg'))
-		self.ui.remove_toolButton.setIcon(self.iconSet('remove.svg'))
-		self.ui.edit_toolButton.setIcon(self.iconSet('edit.svg'))
-		self.ui.searchFilterClear_toolButton.setIcon(self.iconSet('clear.svg'))
-		self.ui.about_toolButton.setIcon(self.iconSet('help-about.svg'))
+		with profiler.span('icons'):
+			self.ui.reload_toolButton.setIcon(self.iconSet('refresh.svg'))
+			self.ui.add_toolButton.setIcon(self.iconSet('add.svg'))
+			self.ui.remove_toolButton.setIcon(self.iconSet('remove.svg'))
+			self.ui.edit_toolButton.setIcon(self.iconSet('edit.svg'))
+			self.ui.searchFilterClear_toolButton.setIcon(self.iconSet('clear.svg'))
+			self.ui.about_toolButton.setIcon(self.iconSet('help-about.svg'))
+			self.statusIcons = {
+				envindex.ADDED: self.iconSet('add.svg'),
+				envindex.MODIFIED: self.iconSet('edit.svg'),
+				envindex.REMOVED: self.iconSet('remove.svg'),
+			}
 
 		# Connect signals & slots
 		self.accepted.connect(self.save)  # Save settings if dialog accepted
 
-		self.ui.reload_toolButton.clicked.connect(self.reloadEnvVars)
+		self.ui.reload_toolButton.clicked.connect(lambda: self.reloadEnvVars(streamed=True))
 		self.ui.add_toolButton.clicked.connect(lambda: self.addEnvVar())
 		self.ui.remove_toolButton.clicked.connect(self.removeEnvVars)
 		self.ui.edit_toolButton.clicked.connect(self.editEnvVar)
@@ -89,20 +127,190 @@ class EnvVarsDialog(QtWidgets.QDialog, UI.TemplateUI):
 		self.ui.searchValues_checkBox.toggled.connect(lambda: self.populateEnvVarList())
 
 		self.ui.envVars_treeWidget.itemSelectionChanged.connect(self.updateToolbarUI)
+
+		# Clipboard actions. The shortcuts take precedence over the list
+		# view's own handling of copy, which only copies the current cell.
+		tree = self.ui.envVars_treeWidget
+		for label, format, shortcut in (
+			("Copy", envstore.FORMAT_KEY_VALUE, QtGui.QKeySequence.Copy),
+			("Copy as shell exports", envstore.FORMAT_SHELL, None),
+			("Copy as JSON", envstore.FORMAT_JSON, None),
+		):
+			action = QtWidgets.QAction(label, tree)
+			action.triggered.connect(lambda checked=False, format=format: self.copyEnvVars(format))
+			if shortcut is not None:
+				action.setShortcut(shortcut)
+				action.setShortcutContext(QtCore.Qt.WidgetWithChildrenShortcut)
+			tree.addAction(action)
+		pasteAction = QtWidgets.QAction("Paste...", tree)
+		pasteAction.triggered.connect(self.pasteEnvVars)
+		pasteAction.setShortcut(QtGui.QKeySequence.Paste)
+		pasteAction.setShortcutContext(QtCore.Qt.WidgetWithChildrenShortcut)
+		tree.addAction(pasteAction)
+		tree.setContextMenuPolicy(QtCore.Qt.ActionsContextMenu)
+
 		self.ui.envVars_treeWidget.itemDoubleClicked.connect(self.editEnvVar)
+		self.ui.envVars_treeWidget.itemExpanded.connect(self.expandGroup)
+		self.ui.envVars_treeWidget.itemCollapsed.connect(self.collapseGroup)
+
+		self.ui.grouping_comboBox.currentIndexChanged.connect(self.setGrouping)
+		self.ui.sortMode_comboBox.currentIndexChanged.connect(self.setSortMode)
+		self.ui.envVars_treeWidget.header().sectionClicked.connect(self.headerClicked)
 
 		self.ui.about_toolButton.clicked.connect(self.about_dialog)
 
+		# Tools menu
+		self.addContextMenu(self.ui.tools_toolButton, "Find and replace...", self.findReplace)
+		self.addContextMenu(self.ui.tools_toolButton, "Select, delete or rename by pattern...", self.bulkKeys)
+		self.addContextMenu(self.ui.tools_toolButton, "Environment block size...", self.showBlockSize)
+		self.addContextMenu(self.ui.tools_toolButton, "Pending changes...", self.showPendingChanges)
+		self.addContextMenu(self.ui.tools_toolButton, "Environment history...", self.showHistory)
+		self.addContextMenu(self.ui.tools_toolButton, "Run with this environment...", self.showLaunch)
+		self.addContextMenu(self.ui.tools_toolButton, "Load snapshot...", lambda: self.loadSnapshot())
+		self.addContextMenu(self.ui.tools_toolButton, "Load Windows snapshot...", lambda: self.loadSnapshot(windows=True))
+		self.addContextMenu(self.ui.tools_toolButton, "New panel", self.newPanel)
+
 		self.ui.main_buttonBox.button(QtWidgets.QDialogButtonBox.Save).clicked.connect(self.accept)
 		self.ui.main_buttonBox.button(QtWidgets.QDialogButtonBox.Cancel).clicked.connect(self.reject)
 
 		# Sort by key column
 		self.ui.envVars_treeWidget.sortByColumn(0, QtCore.Qt.AscendingOrder)
-
-		self.reloadEnvVars()
+		self.ui.envVars_treeWidget.setColumnHidden(SORT_COLUMN, True)
+		self.sortMode = envindex.SORT_KEY
+
+		self._filterCache = None
+		self._searchValues = None  # (scope, {key: lower-case value})
+		self._pendingKeys = []
+		self._refreshPending = False
+		self.filteredKeys = []
+		self.blockSizeDialog = None
+		self.pendingChangesDialog = None
+		self.historyDialog = None
+		self.launchDialog = None
+
+		# Timer for populating the list view in chunks
+		self.populateTimer = QtCore.QTimer(self)
+		self.populateTimer.setInterval(0)
+		self.populateTimer.setSingleShot(True)
+		self.populateTimer.timeout.connect(self.populateChunk)
+
+		# The list is populated by firstPaint, not here
+		self.setGrouping(self.ui.grouping_comboBox.currentIndex(), populate=False)
+		self.ui.searchFilter_lineEdit.blockSignals(True)
+		self.ui.searchFilter_lineEdit.setText(searchFilter)
+		self.ui.searchFilter_lineEdit.blockSignals(False)
+
+		# Receive changes made to the model by other panels
+		self.model.subscribe(self.modelChanged)
+
+		# Timer for sampling the process environment for the history
+		self.historyTimer = QtCore.QTimer(self)
+		self.historyTimer.timeout.connect(self.sampleHistory)
+		self.historyTimer.start(HISTORY_INTERVAL*1000)
+
+		# Show timing overlay if profiling is enabled
+		if profiler.ENABLED:
+			self.profilerTimer = QtCore.QTimer(self)
+			self.profilerTimer.timeout.connect(self.updateStatusUI)
+			self.profilerTimer.start(500)
+
+		# Defer reading the environment until the window has been shown
+		QtCore.QTimer.singleShot(0, self.firstPaint)
 		#self.updateToolbarUI()
 
 
+	def firstPaint(self):
+		"""Called from the event loop once the window has been shown. Record
+		the time to first paint and start populating the list.
+		"""
+		if profiler.ENABLED:
+			profiler.record('firstPaint', self._startTime, profiler.now())
+
+		# Other panels may already have loaded the shared model
+		if self.model.loaded:
+			self.rebuildIndices()
+			self.populateEnvVarList(streamed=True)
+		else:
+			self.reloadEnvVars(streamed=True)
+
+
+	# Shared model accessors
+	environ = property(lambda self: self.model.environ)
+	changes = property(lambda self: self.model.changes)
+	sizeAnalyzer = property(lambda self: self.model.sizeAnalyzer)
+	sortKeys = property(lambda self: self.model.sortKeys)
+	pathIndex = property(lambda self: self.model.pathIndex)
+
+
+	def modelChanged(self, changed, removed, reset, source):
+		"""Called when the shared model has been changed. Changes made by
+		this panel have already been handled; for changes made by other
+		panels, update the view state and schedule a refresh.
+		"""
+		if source is self:
+			return
+
+		if reset:
+			# The baseline has changed, so cached matches may include
+			# removed variables which no longer exist anywhere
+			self._filterCache = None
+			self._searchValues = None
+			self.groupIndex.pathsep = self.environ.pathsep
+			self.groupIndex.rebuild(self.environ)
+		else:
+			for key in changed:
+				self.groupIndex.update(self.environ, key)
+			for key in removed:
+				self.groupIndex.remove(key)
+
+		self.scheduleRefresh()
+
+
+	def scheduleRefresh(self):
+		"""Schedule a refresh of the list view. Bursts of notifications are
+		coalesced into a single refresh.
+		"""
+		if not self._refreshPending:
+			self._refreshPending = True
+			QtCore.QTimer.singleShot(0, self.refreshView)
+
+
+	def refreshView(self):
+		"""Repopulate the list view after the model has been changed by
+		another panel. Hidden panels are refreshed when they are next shown.
+		"""
+		if not self.isVisible():
+			return
+
+		self._refreshPending = False
+		selected = self.selectedKeys()
+		self.populateEnvVarList(selectItem=selected[0] if selected else None)
+		self.refreshPanels()
+
+
+	def newPanel(self):
+		"""Open another panel on the same shared environment, with the same
+		search filter.
+		"""
+		panel = EnvVarsDialog(parent=self.parent, model=self.model,
+			searchFilter=self.ui.searchFilter_lineEdit.text())
+		panel.setAttribute(QtCore.Qt.WA_DeleteOnClose, True)
+		panel.finished.connect(panel.detach)  # Save / Cancel
+		_panels.append(panel)
+		panel.show()
+
+
+	def detach(self, *args):
+		"""Stop receiving changes from the model and release an extra
+		panel, before it is deleted.
+		"""
+		self.model.unsubscribe(self.modelChanged)
+		self.historyTimer.stop()
+		self.populateTimer.stop()
+		if self in _panels:
+			_panels.remove(self)
+
+
 	def updateToolbarUI(self):
 		"""Update the toolbar UI based on the current selection."""
 
@@ -120,85 +328,511 @@ class EnvVarsDialog(QtWidgets.QDialog, UI.TemplateUI):
 			self.ui.edit_toolButton.setEnabled(False)
 
 
-	def reloadEnvVars(self):
+	def updateStatusUI(self):
+		"""Update the status label with the memory usage of the environment
+		store and, if profiling is enabled, the last and p95 timings.
+		"""
+		compact, raw = self.environ.memoryUsage()
+		status = "%d variables, %s in memory (%s uncompacted)" % (
+			len(self.environ), envstore.formatBytes(compact), envstore.formatBytes(raw))
+		usage = self.sizeAnalyzer.usage()
+		if usage is not None:
+			status += ", %.1f%% of environment size limit" % (usage*100)
+		if self.changes:
+			status += ", %d pending change(s)" % len(self.changes)
+		toolTip = ""
+
+		if profiler.ENABLED:
+			status += "  |  " + profiler.summary()
+			toolTip = profiler.report()
+
+		self.ui.status_label.setText(status)
+		self.ui.status_label.setToolTip(toolTip)
+
+
+	@profiler.timed('reload')
+	def reloadEnvVars(self, streamed=False):
 		"""Reload environment variables by making a copy of the os.environ
-		dictionary.
+		dictionary. Values are held in a compact store with path-list values
+		interned. The environment is shared, so all panels are reloaded.
+
+		If 'streamed' is True the list view is populated in chunks from the
+		event loop so the window stays responsive.
 		"""
-		self.environ = dict(os.environ)
-		self.populateEnvVarList()
+		self.model.reload(source=self)
+		self.rebuildIndices()
+		self.populateEnvVarList(streamed=streamed)
+
+
+	def loadSnapshot(self, windows=False):
+		"""Load an environment snapshot file in place of the current
+		environment. Windows snapshots are loaded with case-insensitive keys
+		and ';' as the path separator, so they can be edited on any platform.
+		"""
+		filepath = self.fileDialog(os.getcwd())
+		if not filepath:
+			return
+
+		try:
+			if windows:
+				environ = envstore.loadSnapshot(filepath, caseSensitive=False, pathsep=';')
+			else:
+				environ = envstore.loadSnapshot(filepath)
+		except (OSError, ValueError) as e:
+			self.errorDialog("Could not load snapshot: %s" % e, "Snapshot not loaded")
+			return
+		self.model.reload(environ, source=self)
+		self.rebuildIndices()
+		self.populateEnvVarList(streamed=True)
+
+
+	def rebuildIndices(self):
+		"""Rebuild this panel's indices over the environment in one go.
+		Called on reload; the shared indices are rebuilt by the model.
+		"""
+		self.groupIndex.pathsep = self.environ.pathsep
+		self.groupIndex.rebuild(self.environ)
+		self.refreshPanels()
+
+
+	def updateIndices(self, changed=(), removed=()):
+		"""Update all indices after the variables in 'changed' have been
+		added or modified and the variables in 'removed' have been removed.
+
+		Changed keys are indexed under the spelling they are stored under, so
+		in a case-insensitive environment 'path' updates the entry for
+		'Path'.
+		"""
+		changed = [self.environ.canonicalKey(key) or key for key in changed]
+		for key in removed:
+			self.groupIndex.remove(key)
+		for key in changed:
+			self.groupIndex.update(self.environ, key)
+		self.model.apply(changed, removed, source=self)
+		self.refreshPanels()
+
 
+	def refreshPanels(self):
+		"""Refresh any open modeless panels."""
 
-	def populateEnvVarList(self, selectItem=None): #, searchFilter=""):
+		if self.blockSizeDialog is not None and self.blockSizeDialog.isVisible():
+			self.blockSizeDialog.refresh()
+		if self.pendingChangesDialog is not None and self.pendingChangesDialog.isVisible():
+			self.pendingChangesDialog.refresh()
+		if self.historyDialog is not None and self.historyDialog.isVisible():
+			self.historyDialog.refresh()
+
+
+	def errorDialog(self, errorMsg, dialogTitle):
+		"""Print an error message and show it in a dialog, as printed
+		messages may not be seen inside a host application.
+		"""
+		print(errorMsg)
+		self.promptDialog(errorMsg, dialogTitle)
+
+
+	def valueOf(self, key):
+		"""Return the value of a variable, falling back to its live value if
+		it has been removed, or None if it is in neither (e.g. a stale row
+		after a save).
+		"""
+		try:
+			return self.environ[key]
+		except KeyError:
+			return self.changes.baseline.get(key)
+
+
+	def setGrouping(self, mode, populate=True):
+		"""Set the grouping mode for the list view. If 'populate' is True
+		and the environment has been loaded, rebuild the group index and
+		repopulate the list.
+		"""
+		tree = self.ui.envVars_treeWidget
+		grouped = mode != envindex.GROUP_NONE
+		tree.setItemsExpandable(grouped)
+		tree.setRootIsDecorated(grouped)
+		tree.setIndentation(tree.fontMetrics().height() if grouped else 0)
+
+		self.groupIndex = envindex.GroupIndex(mode)
+		self.expandedGroups = set()
+		if populate and self.model.loaded:
+			self.groupIndex.rebuild(self.environ)
+			self.populateEnvVarList()
+
+
+	def setSortMode(self, mode):
+		"""Set the sort mode for the list view.
+
+		Sort keys are taken from the cache, so switching mode is a single
+		reorder of the existing entries.
+		"""
+		tree = self.ui.envVars_treeWidget
+		self.sortMode = mode
+
+		if mode == envindex.SORT_KEY:
+			tree.sortByColumn(0, QtCore.Qt.AscendingOrder)
+			return
+
+		tree.setUpdatesEnabled(False)
+		tree.setSortingEnabled(False)
+		iterator = QtWidgets.QTreeWidgetItemIterator(tree)
+		while iterator.value():
+			item = iterator.value()
+			if item.data(0, QtCore.Qt.UserRole) is None:  # Skip group items
+				self.setSortKey(item)
+			else:
+				item.setText(SORT_COLUMN, item.text(0))
+			iterator += 1
+
+		if mode in envindex.SORT_DESCENDING:
+			order = QtCore.Qt.DescendingOrder
+		else:
+			order = QtCore.Qt.AscendingOrder
+		tree.sortByColumn(SORT_COLUMN, order)
+		tree.setSortingEnabled(True)
+		tree.setUpdatesEnabled(True)
+
+
+	def setSortKey(self, item):
+		"""Set the hidden sort key of a list view entry for the current sort
+		mode.
+		"""
+		key = self.entryKey(item)
+		item.setText(SORT_COLUMN, envstore.displayValue(self.sortKeys.sortKey(
+			self.sortMode, key, self.changes.status.get(key))))
+
+
+	def headerClicked(self, column):
+		"""Revert to the plain sort modes when the user sorts by clicking a
+		column header.
+		"""
+		if column != SORT_COLUMN and self.sortMode != envindex.SORT_KEY:
+			self.sortMode = envindex.SORT_KEY
+			self.ui.sortMode_comboBox.blockSignals(True)
+			self.ui.sortMode_comboBox.setCurrentIndex(envindex.SORT_KEY)
+			self.ui.sortMode_comboBox.blockSignals(False)
+
+
+	@profiler.timed('filter')
+	def filterKeys(self, searchFilter):
+		"""Return a list of keys matching the search filter.
+
+		The result is cached, and if the filter is a refinement of the
+		previous one (e.g. the user typed another character) only the
+		previous matches are tested. While a filter is active the lower-case
+		values are cached too, so that path lists are only materialised once
+		per search rather than on every keystroke.
+		"""
+		scope = (
+			self.getCheckBoxValue(self.ui.searchKeys_checkBox),
+			self.getCheckBoxValue(self.ui.searchValues_checkBox),
+			id(self.environ),
+			self.environ.version,
+		)
+		searchFilter = searchFilter.lower()  # Case-insensitive
+		rawSearch = '\\x' in searchFilter  # Searching for escaped bytes
+
+		# Removed variables stay in the list until the changes are saved
+		allKeys = list(self.environ.keys()) + self.changes.removedKeys()
+
+		if not searchFilter:
+			matches = allKeys
+			self._searchValues = None
+		else:
+			candidates = allKeys
+			if self._filterCache is not None:
+				prevScope, prevFilter, prevMatches = self._filterCache
+				if prevScope == scope and prevFilter in searchFilter:
+					candidates = prevMatches
+			if self._searchValues is None or self._searchValues[0] != scope:
+				self._searchValues = (scope, {})
+			values = self._searchValues[1]
+
+			searchKeys, searchValues = scope[:2]
+			matches = [
+				key for key in candidates
+				if (searchKeys and searchFilter in key.lower())
+				or (searchValues and searchFilter in self.searchValue(key, values))
+				or (rawSearch and searchFilter in self.searchText(key))
+			]
+
+		self._filterCache = (scope, searchFilter, matches)
+		return matches
+
+
+	def searchValue(self, key, values):
+		"""Return the lower-case value of a variable for matching a search
+		filter, caching it in the dictionary 'values'.
+		"""
+		try:
+			return values[key]
+		except KeyError:
+			value = values[key] = self.valueOf(key).lower()
+			return value
+
+
+	def searchText(self, key):
+		"""Return the key and value of a variable as displayed, for matching
+		a search filter containing \\xNN escapes.
+		"""
+		text = ""
+		if self.getCheckBoxValue(self.ui.searchKeys_checkBox):
+			text += envstore.displayValue(key).lower() + "\n"
+		if self.getCheckBoxValue(self.ui.searchValues_checkBox):
+			text += envstore.displayValue(self.valueOf(key)).lower()
+		return text
+
+
+	@profiler.timed('populate')
+	def populateEnvVarList(self, selectItem=None, streamed=False):
 		"""Populate the environment variables list view.
 
 		'selectItem' specifies an item by name that will be selected
 		automatically.
-		'searchFilter' is a search string to filter the list.
+		In grouped mode only the group items are created here; the children
+		of a group are created when it is expanded.
+		If 'streamed' is True only the first chunk of entries is created
+		here, in display order, and the rest are created from the event loop.
 		"""
+		tree = self.ui.envVars_treeWidget
 		searchFilter = self.ui.searchFilter_lineEdit.text()
+		self.ui.searchFilterClear_toolButton.setEnabled(searchFilter != "")
+		self.filteredKeys = self.filterKeys(searchFilter)
 
-		# Stop the widget from emitting signals
-		self.ui.envVars_treeWidget.blockSignals(True)
-
-		# Clear tree widget
-		self.ui.envVars_treeWidget.clear()
-
-		for key, value in self.environ.items():
+		# Cancel any population still in progress
+		self.populateTimer.stop()
+		self._pendingKeys = []
 
-			# Populate list view, using filter
-			if searchFilter != "":
-				searchScope = ""
-				if self.getCheckBoxValue(self.ui.searchKeys_checkBox):
-					searchScope += key.lower()
-				if self.getCheckBoxValue(self.ui.searchValues_checkBox):
-					searchScope += value.lower()
-				if searchFilter.lower() in searchScope:  # Case-insensitive
-					item = self.envVarEntry(key, value)
-				self.ui.searchFilterClear_toolButton.setEnabled(True)
+		# Stop the widget from emitting signals, and sort once at the end
+		# rather than on every insert
+		tree.blockSignals(True)
+		tree.setUpdatesEnabled(False)
+		tree.setSortingEnabled(False)
 
+		# Clear tree widget
+		tree.clear()
+		self.groupItems = {}
+		self.groupMembers = collections.defaultdict(list)
+
+		ungrouped = []
+		for key in self.filteredKeys:
+			group = self.groupIndex.group(key)
+			if group is None:
+				ungrouped.append(key)
 			else:
-				item = self.envVarEntry(key, value)
-				self.ui.searchFilterClear_toolButton.setEnabled(False)
+				self.groupMembers[group].append(key)
 
-			if selectItem == key:
-				selectedItem = item
+		for group, keys in self.groupMembers.items():
+			item = self.groupEntry(group, len(keys))
+			if group in self.expandedGroups:
+				item.setExpanded(True)
+				self.populateGroup(item)
+
+		if streamed:
+			self._pendingKeys = self.displayOrder(ungrouped)
+		else:
+			for key in ungrouped:
+				self.envVarEntry(key, self.valueOf(key))
+			tree.setSortingEnabled(True)
 
 		self.updateToolbarUI()
+		self.updateStatusUI()
 
 		# Resize column zero (Keys)
-		self.ui.envVars_treeWidget.resizeColumnToContents(0)
+		tree.resizeColumnToContents(0)
 
 		# Re-enable signals
-		self.ui.envVars_treeWidget.blockSignals(False)
+		tree.setUpdatesEnabled(True)
+		tree.blockSignals(False)
+
+		if streamed:
+			self.populateChunk()
 
 		# Set selection - view will also scroll to show selection
 		if selectItem is not None:
-			self.ui.envVars_treeWidget.setCurrentItem(selectedItem)
+			item = self.findEnvVarItem(selectItem)
+			if item is not None:
+				tree.setCurrentItem(item)
+
+
+	def displayOrder(self, keys):
+		"""Return the keys sorted in the order the list view displays them."""
+
+		tree = self.ui.envVars_treeWidget
+		reverse = tree.header().sortIndicatorOrder() == QtCore.Qt.DescendingOrder
+		if tree.sortColumn() == SORT_COLUMN:
+			sortKey = lambda key: self.sortKeys.sortKey(
+				self.sortMode, key, self.changes.status.get(key))
+			return sorted(keys, key=sortKey, reverse=reverse)
+		if tree.sortColumn() == 1:
+			return sorted(keys, key=self.valueOf, reverse=reverse)
+		return sorted(keys, reverse=reverse)
+
+
+	def populateChunk(self):
+		"""Create the next chunk of pending list view entries, and schedule
+		the following chunk from the event loop.
+		"""
+		tree = self.ui.envVars_treeWidget
+		chunk = self._pendingKeys[:POPULATE_CHUNK_SIZE]
+		del self._pendingKeys[:POPULATE_CHUNK_SIZE]
+
+		tree.setUpdatesEnabled(False)
+		for key in chunk:
+			self.envVarEntry(key, self.valueOf(key))
+		tree.setUpdatesEnabled(True)
+
+		if self._pendingKeys:
+			self.populateTimer.start()
+		else:
+			tree.setSortingEnabled(True)
+			tree.resizeColumnToContents(0)
+
+
+	def populateGroup(self, groupItem):
+		"""Create the child entries of a group item, if not already done."""
+
+		if groupItem.childCount():
+			return
+
+		group = groupItem.data(0, QtCore.Qt.UserRole)
+		for key in self.groupMembers.get(group, []):
+			self.envVarEntry(key, self.valueOf(key), parent=groupItem)
+
 
+	def expandGroup(self, item):
+		"""Populate a group item when it is expanded."""
 
-	def envVarEntry(self, key, value):
+		group = item.data(0, QtCore.Qt.UserRole)
+		if group is None:
+			return
+
+		self.expandedGroups.add(group)
+		self.ui.envVars_treeWidget.setUpdatesEnabled(False)
+		self.populateGroup(item)
+		self.ui.envVars_treeWidget.setUpdatesEnabled(True)
+
+
+	def collapseGroup(self, item):
+		"""Discard the children of a group item when it is collapsed, so that
+		collapsed groups cost nothing.
+		"""
+		group = item.data(0, QtCore.Qt.UserRole)
+		if group is None:
+			return
+
+		self.expandedGroups.discard(group)
+		item.takeChildren()
+
+
+	def findEnvVarItem(self, key):
+		"""Return the list view item for the given key, expanding its group
+		if necessary. Return None if the key is not shown.
+		"""
+		tree = self.ui.envVars_treeWidget
+		group = self.groupIndex.group(key)
+		if group is None:
+			parent = tree.invisibleRootItem()
+		else:
+			parent = self.groupItems.get(group)
+			if parent is None:
+				return None
+			parent.setExpanded(True)  # Populates the group
+			self.populateGroup(parent)
+
+		for i in range(parent.childCount()):
+			item = parent.child(i)
+			if self.entryKey(item) == key:
+				return item
+
+		return None
+
+
+	def envVarEntry(self, key, value, parent=None):
 		"""Return a new entry in the environment variables list view."""
 
+		item = QtWidgets.QTreeWidgetItem(parent or self.ui.envVars_treeWidget)
+		item.setData(0, KEY_ROLE, key)
+		for column, text in ((0, key), (1, value)):
+			if envstore.hasRawBytes(text):
+				item.setText(column, envstore.displayValue(text))
+				item.setToolTip(column, "Bytes which are not valid in the file system encoding are shown as \\xNN escapes.")
+			else:
+				item.setText(column, text)
+
+		status = self.changes.status.get(key)
+		if status is not None:
+			self.setEntryStatus(item, status)
+
+		if self.sortMode != envindex.SORT_KEY:
+			self.setSortKey(item)
+
+		return item
+
+
+	def entryKey(self, item):
+		"""Return the key of a list view entry, or None for a group."""
+
+		return item.data(0, KEY_ROLE)
+
+
+	def setEntryStatus(self, item, status):
+		"""Mark a list view entry as added, modified or removed. Removed
+		entries are greyed out.
+		"""
+		item.setIcon(0, self.statusIcons[status])
+		item.setToolTip(0, "Pending change: %s" % status)
+		if status == envindex.REMOVED:
+			for column in (0, 1):
+				font = item.font(column)
+				font.setStrikeOut(True)
+				item.setFont(column, font)
+				item.setForeground(column, self.palette().brush(
+					QtGui.QPalette.Disabled, QtGui.QPalette.Text))
+
+
+	def groupEntry(self, group, count):
+		"""Return a new group entry in the environment variables list view.
+		Children are not created until the group is expanded.
+		"""
 		item = QtWidgets.QTreeWidgetItem(self.ui.envVars_treeWidget)
-		item.setText(0, key)
-		item.setText(1, value)
+		item.setData(0, QtCore.Qt.UserRole, group)
+		item.setText(SORT_COLUMN, group)
+		item.setFlags(QtCore.Qt.ItemIsEnabled)
+		item.setChildIndicatorPolicy(QtWidgets.QTreeWidgetItem.ShowIndicator)
+		self.setGroupCount(item, count)
+		font = item.font(0)
+		font.setBold(True)
+		item.setFont(0, font)
+		self.groupItems[group] = item
 
 		return item
 
 
+	def setGroupCount(self, item, count):
+		"""Update the label of a group item with its member count."""
+
+		group = item.data(0, QtCore.Qt.UserRole)
+		item.setText(0, group)
+		item.setText(1, "%d variable(s)" % count)
+
+
+	@profiler.timed('add')
 	def addEnvVar(self, value=""):
 		"""Open the edit environment variable dialog to add a new env var.
 
-		TODO: on Windows, when checking if the env var already exists, the
-		check should be case-insensitive.
+		The check for an existing env var follows the key semantics of the
+		environment, so it is case-insensitive on Windows.
 		"""
+		import edit_envvar
 		editEnvVarDialog = edit_envvar.Dialog(parent=self)
-		if editEnvVarDialog.display("", value):
+		if editEnvVarDialog.display("", value, pathIndex=self.pathIndex, pathsep=self.environ.pathsep):
 			if editEnvVarDialog.key not in self.environ:
 				self.environ[editEnvVarDialog.key] = editEnvVarDialog.value
+				self.updateIndices(changed=[editEnvVarDialog.key])
 				self.populateEnvVarList(selectItem=editEnvVarDialog.key)
 			else:
-				errorMsg = "The environment variable '%s' already exists." %editEnvVarDialog.key
+				errorMsg = "The environment variable '%s' already exists." %self.environ.canonicalKey(editEnvVarDialog.key)
 				dialogMsg = errorMsg + "\nWould you like to create an environment variable with a different name?"
 				print(errorMsg)
 
@@ -209,26 +843,334 @@ class EnvVarsDialog(QtWidgets.QDialog, UI.TemplateUI):
 					self.addEnvVar(editEnvVarDialog.value)
 
 
+	@profiler.timed('edit')
 	def editEnvVar(self):
 		"""Open edit environment variable dialog."""
 
-		item = self.ui.envVars_treeWidget.selectedItems()[0]
-		key = item.text(0)
-		value = item.text(1)
+		if len(self.ui.envVars_treeWidget.selectedItems()) != 1:
+			return
 
-		editEnvVarDialog = edit_envvar.Dialog(parent=self)
-		if editEnvVarDialog.display(key, value):
-			self.environ[editEnvVarDialog.key] = editEnvVarDialog.value
-			self.populateEnvVarList(selectItem=editEnvVarDialog.key)
+		item = self.ui.envVars_treeWidget.selectedItems()[0]
+		key = self.entryKey(item)
+		value = self.valueOf(key)  # Editing a removed variable restores it
+		if value is None:
+			return
 
+		# Undecodable bytes are edited as escapes so they survive the round
+		# trip through Qt
+		rawBytes = envstore.hasRawBytes(value)
+		if rawBytes:
+			value = envstore.displayValue(value)
 
+		import edit_envvar
+		editEnvVarDialog = edit_envvar.Dialog(parent=self)
+		if editEnvVarDialog.display(envstore.displayValue(key), value,
+			pathIndex=self.pathIndex, pathsep=self.environ.pathsep):
+			value = editEnvVarDialog.value
+			if rawBytes:
+				value = envstore.storedValue(value)
+			# The key is read-only, so use the original, which may contain
+			# undecodable bytes
+			self.environ[key] = value
+			self.updateIndices(changed=[key])
+			self.populateEnvVarList(selectItem=key)
+
+
+	@profiler.timed('remove')
 	def removeEnvVars(self):
 		"""Remove the selected environment variable(s)."""
 
-		for item in self.ui.envVars_treeWidget.selectedItems():
-			self.environ.pop(item.text(0), None)
-			index = self.ui.envVars_treeWidget.indexOfTopLevelItem(item)
-			self.ui.envVars_treeWidget.takeTopLevelItem(index)
+		tree = self.ui.envVars_treeWidget
+		items = [item for item in tree.selectedItems() if self.entryKey(item) in self.environ]
+		removed = [self.entryKey(item) for item in items]
+		for key in removed:
+			del self.environ[key]
+		self.updateIndices(removed=removed)
+		self.removeEntries(items)
+		self.updateStatusUI()
+
+
+	def removeEntries(self, items):
+		"""Remove the given list view entries, or grey them out if they are
+		pending removal.
+
+		Each affected parent is rebuilt in a single pass rather than looking
+		up and taking each item individually, which would be quadratic on
+		large selections.
+		"""
+		tree = self.ui.envVars_treeWidget
+		keysByGroup = collections.defaultdict(set)
+		for item in items:
+			parent = item.parent()
+			group = None if parent is None else parent.data(0, QtCore.Qt.UserRole)
+			keysByGroup[group].add(self.entryKey(item))
+
+		sorting = tree.isSortingEnabled()
+		tree.setUpdatesEnabled(False)
+		tree.setSortingEnabled(False)
+
+		for group, keys in keysByGroup.items():
+			if group is None:
+				parent = tree.invisibleRootItem()
+			else:
+				parent = self.groupItems[group]
+
+			keep = []
+			for child in parent.takeChildren():
+				key = self.entryKey(child)
+				if key in keys and child.data(0, QtCore.Qt.UserRole) is None:
+					if self.changes.status.get(key) != envindex.REMOVED:
+						continue
+					self.setEntryStatus(child, envindex.REMOVED)  # Keep visible
+				keep.append(child)
+			parent.addChildren(keep)
+
+			if group is not None:
+				self.groupMembers[group] = [key for key in self.groupMembers[group]
+				                            if key not in keys or key in self.changes.baseline]
+				self.setGroupCount(parent, parent.childCount())
+				parent.setHidden(parent.childCount() == 0)
+
+		# Group items taken from the root are re-added collapsed
+		if None in keysByGroup:
+			for group in list(self.expandedGroups):
+				if group in self.groupItems:
+					self.groupItems[group].setExpanded(True)
+
+		tree.setSortingEnabled(sorting)
+		tree.setUpdatesEnabled(True)
+
+
+	def visibleKeys(self):
+		"""Return a list of the keys matching the current search filter."""
+
+		return [key for key in self.filteredKeys if key in self.environ]
+
+
+	def selectedKeys(self):
+		"""Return a list of the keys currently selected in the list view,
+		excluding removed variables.
+		"""
+		return [self.entryKey(item) for item in self.ui.envVars_treeWidget.selectedItems()
+		        if self.entryKey(item) in self.environ]
+
+
+	@profiler.timed('findReplace')
+	def findReplace(self):
+		"""Open the find and replace dialog and apply all replacements in a
+		single batch.
+		"""
+		import find_replace
+		findReplaceDialog = find_replace.Dialog(parent=self)
+		if findReplaceDialog.display(self.environ, self.visibleKeys(), self.selectedKeys()):
+			replacements = findReplaceDialog.replacements
+			self.environ.update(replacements)
+			self.updateIndices(changed=replacements)
+			selectItem = self.selectedKeys()[0] if self.selectedKeys() else None
+			self.populateEnvVarList(selectItem=selectItem)
+			print("Replaced values of %d environment variable(s)." % len(replacements))
+
+
+	def bulkKeys(self):
+		"""Open the dialog to select, delete or rename variables whose keys
+		match a wildcard pattern.
+		"""
+		import bulk_keys
+		bulkKeysDialog = bulk_keys.Dialog(parent=self)
+		if bulkKeysDialog.display(list(self.environ.keys()), caseSensitive=self.environ.caseSensitive):
+			if bulkKeysDialog.operation == bulk_keys.SELECT:
+				self.selectKeys(bulkKeysDialog.keys)
+			elif bulkKeysDialog.operation == bulk_keys.DELETE:
+				self.deleteKeys(bulkKeysDialog.keys)
+			elif bulkKeysDialog.operation == bulk_keys.RENAME:
+				self.renameKeys(bulkKeysDialog.renames)
+
+
+	def selectKeys(self, keys):
+		"""Select the list view entries for the given keys, expanding any
+		groups containing them.
+		"""
+		tree = self.ui.envVars_treeWidget
+		keys = set(keys)
+		for key in keys:
+			group = self.groupIndex.group(key)
+			if group in self.groupItems:
+				self.groupItems[group].setExpanded(True)
+
+		tree.blockSignals(True)
+		tree.clearSelection()
+		iterator = QtWidgets.QTreeWidgetItemIterator(tree)
+		while iterator.value():
+			item = iterator.value()
+			if self.entryKey(item) in keys and item.data(0, QtCore.Qt.UserRole) is None:
+				item.setSelected(True)
+			iterator += 1
+		tree.blockSignals(False)
+		self.updateToolbarUI()
+
+
+	@profiler.timed('deleteKeys')
+	def deleteKeys(self, keys):
+		"""Delete the given variables as a single batch."""
+
+		removed = [key for key in keys if key in self.environ]
+		for key in removed:
+			del self.environ[key]
+		self.updateIndices(removed=removed)
+		self.populateEnvVarList()
+		print("Deleted %d environment variable(s)." % len(removed))
+
+
+	@profiler.timed('renameKeys')
+	def renameKeys(self, renames):
+		"""Rename variables as a single batch. 'renames' maps old keys to new
+		keys.
+		"""
+		try:
+			self.environ.renameKeys(renames)
+		except ValueError as e:
+			self.errorDialog("Variables not renamed: %s" % e, "Variables not renamed")
+			return
+		# Old keys which are gone, or now spelled differently
+		removed = [key for key in renames if self.environ.canonicalKey(key) != key]
+		self.updateIndices(changed=renames.values(), removed=removed)
+		self.populateEnvVarList()
+		print("Renamed %d environment variable(s)." % len(renames))
+
+
+	def showBlockSize(self):
+		"""Show the environment block size panel."""
+
+		if self.blockSizeDialog is None:
+			import block_size
+			self.blockSizeDialog = block_size.Dialog(parent=self)
+		self.blockSizeDialog.display(self.sizeAnalyzer)
+
+
+	@profiler.timed('compactPaths')
+	def compactPaths(self, removeMissing=True):
+		"""Remove duplicate and (optionally) nonexistent elements from
+		every path-list variable, as a single batch.
+		"""
+		replacements = envsize.compactEnviron(
+			self.environ, removeMissing=removeMissing, pathsep=self.environ.pathsep)
+		if not replacements:
+			return
+
+		before = self.sizeAnalyzer.total
+		self.environ.update(replacements)
+		self.updateIndices(changed=replacements)
+		self.populateEnvVarList()
+		print("Compacted %d environment variable(s), saving %s." % (
+			len(replacements), envstore.formatBytes(before - self.sizeAnalyzer.total)))
+
+
+	def showPendingChanges(self):
+		"""Show the pending changes panel."""
+
+		if self.pendingChangesDialog is None:
+			import pending_changes
+			self.pendingChangesDialog = pending_changes.Dialog(parent=self)
+		self.pendingChangesDialog.display(self.model)
+
+
+	def showHistory(self):
+		"""Show the environment history panel, for the selected variable if
+		there is one.
+		"""
+		if self.historyDialog is None:
+			import history
+			self.historyDialog = history.Dialog(parent=self)
+		keys = self.selectedKeys()
+		self.historyDialog.display(self.model, key=keys[0] if len(keys) == 1 else "")
+
+
+	def showLaunch(self):
+		"""Show the panel for running commands with the edited environment.
+		"""
+		if self.launchDialog is None:
+			import launch
+			self.launchDialog = launch.Dialog(parent=self)
+		self.launchDialog.display(self.model)
+
+
+	def sampleHistory(self):
+		"""Sample the process environment for the history. Panels share the
+		model, so allow for the timers of other panels.
+		"""
+		if self.model.sample(HISTORY_INTERVAL-1) is not None:
+			self.refreshPanels()
+
+
+	def restoreHistory(self, index):
+		"""Restore the environment as it was at the given point in the
+		history. The differences are applied as a single batch and show up
+		as pending changes.
+		"""
+		environ = self.model.history.restore(index)
+		added, removed, modified = environ.diff(self.environ)
+		changed = added + modified
+		for key in changed:
+			self.environ[key] = environ[key]
+		for key in removed:
+			del self.environ[key]
+		self.updateIndices(changed=changed, removed=removed)
+		self.populateEnvVarList()
+
+
+	def revertEnvVars(self, keys):
+		"""Revert the given variables to their live values, as a single
+		batch.
+		"""
+		changed = []
+		removed = []
+		for key in keys:
+			if key in self.changes.baseline:
+				self.environ[key] = self.changes.baseline[key]
+				changed.append(key)
+			elif key in self.environ:
+				del self.environ[key]
+				removed.append(key)
+		self.updateIndices(changed=changed, removed=removed)
+		self.populateEnvVarList()
+
+
+	def copyEnvVars(self, format=envstore.FORMAT_KEY_VALUE):
+		"""Copy the selected variables to the clipboard in the given format.
+		"""
+		keys = sorted(self.selectedKeys())
+		if keys:
+			text = envstore.formatEnviron(((key, self.environ[key]) for key in keys), format)
+			QtWidgets.QApplication.clipboard().setText(text)
+			print("Copied %d environment variable(s)." % len(keys))
+
+
+	@profiler.timed('paste')
+	def pasteEnvVars(self):
+		"""Paste a block of variables from the clipboard, as KEY=VALUE lines,
+		shell exports or JSON. The whole block is parsed in one pass, any
+		conflicts with existing values are resolved in a single dialog, and
+		the result is applied as a single batch.
+		"""
+		text = QtWidgets.QApplication.clipboard().text()
+		try:
+			pasted = envstore.parseSnapshot(text)
+		except ValueError as e:
+			self.errorDialog("Could not parse clipboard: %s" % e, "Nothing pasted")
+			return
+		if not pasted:
+			self.errorDialog("No environment variables found on the clipboard.", "Nothing pasted")
+			return
+
+		import paste_merge
+		pasteMergeDialog = paste_merge.Dialog(parent=self)
+		if pasteMergeDialog.display(self.environ, pasted):
+			values = pasteMergeDialog.values
+			self.environ.update(values)
+			self.updateIndices(changed=list(values))
+			self.populateEnvVarList()
+			self.selectKeys(values)
+			print("Pasted %d environment variable(s)." % len(values))
 
 
 	def clearFilter(self):
@@ -237,15 +1179,21 @@ class EnvVarsDialog(QtWidgets.QDialog, UI.TemplateUI):
 		self.ui.searchFilter_lineEdit.clear()
 
 
+	@profiler.timed('save')
 	def save(self):
 		"""Save data by writing to the os.environ dictionary.
 
-		Existing environment variables will be cleared first.
+		Only the pending changes are written, unless a snapshot was loaded,
+		in which case existing environment variables are cleared first.
 		"""
-		# os.environ = dict(self.environ) # this doesn't actually set the env vars
-		os.environ.clear()
-		for key in self.environ.keys():
-			os.environ[key] = self.environ[key]
+		# The saved environment is the new baseline for pending changes
+		self.model.save(source=self)
+		self._filterCache = None
+		self._searchValues = None
+
+		# Redraw without the pending change icons and removed rows, now or
+		# when the panel is next shown
+		self.scheduleRefresh()
 
 
 	def keyPressEvent(self, event):
@@ -257,19 +1205,50 @@ class EnvVarsDialog(QtWidgets.QDialog, UI.TemplateUI):
 			return
 
 
+	def closeEvent(self, event):
+		"""Event handler for when window is closed."""
+
+		if self in _panels:
+			self.detach()
+		if self.launchDialog is not None:
+			self.launchDialog.close()  # Stops the spawn helper
+		super(EnvVarsDialog, self).closeEvent(event)
+
+
+	def showEvent(self, event):
+		"""Event handler for when window is shown."""
+
+		# Catch up with changes made by other panels while hidden
+		if self._refreshPending:
+			QtCore.QTimer.singleShot(0, self.refreshView)
+		super(EnvVarsDialog, self).showEvent(event)
+
+
 	def hideEvent(self, event):
 		"""Event handler for when window is hidden."""
 
 		self.storeWindow()  # Store window geometry
 
+		if profiler.ENABLED:
+			tracePath = profiler.dumpTrace()
+			if tracePath:
+				print("Timing trace written to %s" % tracePath)
+
 # ----------------------------------------------------------------------------
 # End main dialog class
 # ============================================================================
 # Run functions
 # ----------------------------------------------------------------------------
 
-def run(session):
-	"""Run inside host app."""
+def run(session, newPanel=False):
+	"""Run inside host app.
+
+	All panels share the same environment model. If 'newPanel' is True an
+	additional panel is opened instead of showing the existing one.
+	"""
+	if newPanel and hasattr(session, 'envVarsUI'):
+		session.envVarsUI.newPanel()
+		return
 
 	try:  # Show the UI
 		session.envVarsUI.show()
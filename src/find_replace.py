@@ -0,0 +1,198 @@
+#!/usr/bin/python
+
+# find_replace.py
+#
+# Mike Bonnington <mjbonnington@gmail.com>
+# (c) 2018-2022
+#
+# Find and Replace
+# A dialog for rewriting the values of many environment variables at once,
+# for example when a mount point moves. Supports literal or regular
+# expression patterns, can be limited to the filtered or selected variables
+# and can match whole path elements only. All replacements are computed in a
+# single pass and shown in a preview before being applied.
+
+
+import os
+import re
+
+from Qt import QtCore, QtGui, QtWidgets
+import ui_template as UI
+
+# Import custom modules
+import envstore
+
+
+# ----------------------------------------------------------------------------
+# Configuration
+# ----------------------------------------------------------------------------
+
+cfg = dict(
+	app_id="ic_envvar",  # This should match the Rez package name
+	app_name="Find and Replace",
+	window_object="findReplaceUI",
+
+	ui_file=os.path.join(os.path.dirname(__file__), 'forms', 'find_replace.ui'),
+	stylesheet=None,
+
+	store_window_geometry=False,
+)
+
+# Scope indices, matching the items in scope_comboBox
+SCOPE_ALL = 0
+SCOPE_FILTERED = 1
+SCOPE_SELECTED = 2
+
+# ----------------------------------------------------------------------------
+# Replacement functions
+# ----------------------------------------------------------------------------
+
+def computeReplacements(environ, keys, find, replace,
+	regex=False, wholeElements=False, pathsep=os.pathsep):
+	"""Compute replacements for the values of the given keys.
+
+	Return a dictionary mapping each key whose value would change to its new
+	value. 'environ' is not modified. If 'wholeElements' is True the value is
+	split on 'pathsep' and only elements matched in their entirety are
+	replaced. Raises re.error if 'regex' is True and the pattern is invalid.
+	"""
+	replacements = {}
+	if not find:
+		return replacements
+
+	# Build a single substitution function up front so the loop below does
+	# no per-value setup
+	if regex:
+		pattern = re.compile(find)
+		if wholeElements:
+			def sub(element):
+				if pattern.fullmatch(element):
+					return pattern.sub(replace, element, count=1)
+				return element
+		else:
+			sub = lambda value: pattern.sub(replace, value)
+	else:
+		if wholeElements:
+			sub = lambda element: replace if element == find else element
+		else:
+			sub = lambda value: value.replace(find, replace)
+
+	for key in keys:
+		value = environ[key]
+		if wholeElements:
+			newValue = pathsep.join([sub(e) for e in value.split(pathsep)])
+		elif regex or find in value:
+			newValue = sub(value)
+		else:
+			continue
+		if newValue != value:
+			replacements[key] = newValue
+
+	return replacements
+
+# ----------------------------------------------------------------------------
+# Main dialog class
+# ----------------------------------------------------------------------------
+
+class Dialog(QtWidgets.QDialog, UI.TemplateUI):
+	"""Find and Replace dialog class."""
+
+	def __init__(self, parent=None):
+		super(Dialog, self).__init__(parent)
+		self.parent = parent
+
+		# UI template setup
+		self.setupUI(**cfg)
+		self.conformFormLayoutLabels(self.ui)
+
+		# Set window icon, flags and other Qt attributes
+		self.setWindowIcon(self.iconSet('edit.svg', tintNormal=False))
+		self.setWindowFlags(QtCore.Qt.Dialog)
+		self.setAttribute(QtCore.Qt.WA_DeleteOnClose, True)
+
+		# Connect signals & slots
+		self.ui.find_lineEdit.textChanged.connect(self.updatePreview)
+		self.ui.replace_lineEdit.textChanged.connect(self.updatePreview)
+		self.ui.scope_comboBox.currentIndexChanged.connect(self.updatePreview)
+		self.ui.regex_checkBox.toggled.connect(self.updatePreview)
+		self.ui.wholeElements_checkBox.toggled.connect(self.updatePreview)
+
+		self.ui.buttonBox.button(QtWidgets.QDialogButtonBox.Ok).clicked.connect(self.ok)
+		self.ui.buttonBox.button(QtWidgets.QDialogButtonBox.Cancel).clicked.connect(self.reject)
+
+		self.replacements = {}
+
+
+	def display(self, environ, filteredKeys, selectedKeys):
+		"""Display the dialog.
+
+		'environ' is the environment to operate on. 'filteredKeys' and
+		'selectedKeys' are the keys available for the filtered and selected
+		scopes respectively.
+		"""
+		self.environ = environ
+		self.scopeKeys = {
+			SCOPE_ALL: list(environ.keys()),
+			SCOPE_FILTERED: list(filteredKeys),
+			SCOPE_SELECTED: list(selectedKeys),
+		}
+
+		if selectedKeys:
+			self.ui.scope_comboBox.setCurrentIndex(SCOPE_SELECTED)
+
+		self.updatePreview()
+
+		return self.exec_()
+
+
+	def updatePreview(self):
+		"""Recompute all replacements and update the preview."""
+
+		try:
+			self.replacements = computeReplacements(
+				self.environ,
+				self.scopeKeys[self.ui.scope_comboBox.currentIndex()],
+				self.ui.find_lineEdit.text(),
+				self.ui.replace_lineEdit.text(),
+				regex=self.getCheckBoxValue(self.ui.regex_checkBox),
+				wholeElements=self.getCheckBoxValue(self.ui.wholeElements_checkBox),
+				pathsep=self.environ.pathsep)
+			status = "%d variable(s) will be changed." % len(self.replacements)
+		except re.error as e:
+			self.replacements = {}
+			status = "Invalid expression: %s" % e
+
+		self.ui.preview_treeWidget.setSortingEnabled(False)
+		self.ui.preview_treeWidget.clear()
+		for key, newValue in self.replacements.items():
+			item = QtWidgets.QTreeWidgetItem(self.ui.preview_treeWidget)
+			item.setText(0, envstore.displayValue(key))
+			item.setText(1, envstore.displayValue(self.environ[key]))
+			item.setText(2, envstore.displayValue(newValue))
+		self.ui.preview_treeWidget.setSortingEnabled(True)
+		self.ui.preview_treeWidget.resizeColumnToContents(0)
+
+		self.ui.status_label.setText(status)
+		self.ui.buttonBox.button(QtWidgets.QDialogButtonBox.Ok).setEnabled(
+			bool(self.replacements))
+
+
+	def ok(self):
+		"""Dialog accept function."""
+
+		self.accept()
+
+
+	def keyPressEvent(self, event):
+		"""Event handler to detect when key is pressed."""
+
+		# Prevent Enter / Esc keypresses triggering OK / Cancel buttons.
+		if event.key() == QtCore.Qt.Key_Return \
+		or event.key() == QtCore.Qt.Key_Enter:
+			return
+
+
+	def hideEvent(self, event):
+		"""Event handler for when window is hidden."""
+
+		self.storeWindow()  # Store window geometry
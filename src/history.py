@@ -0,0 +1,147 @@
+#!/usr/bin/python
+
+# history.py
+#
+# Mike Bonnington <mjbonnington@gmail.com>
+# (c) 2018-2022
+#
+# Environment History
+# A panel showing the timeline of the process environment recorded by the
+# environment model. Enter a variable name to see when it changed and what it
+# looked like before. Any point still held can be restored in the browser.
+
+
+import os
+import time
+
+from Qt import QtCore, QtGui, QtWidgets
+import ui_template as UI
+
+# Import custom modules
+import envstore
+
+
+# ----------------------------------------------------------------------------
+# Configuration
+# ----------------------------------------------------------------------------
+
+cfg = dict(
+	app_id="ic_envvar",  # This should match the Rez package name
+	app_name="Environment History",
+	window_object="historyUI",
+
+	ui_file=os.path.join(os.path.dirname(__file__), 'forms', 'history.ui'),
+	stylesheet=None,
+
+	store_window_geometry=True,
+)
+
+# Maximum number of changed keys listed for each snapshot
+KEYS_SHOWN = 8
+
+# ----------------------------------------------------------------------------
+# Main dialog class
+# ----------------------------------------------------------------------------
+
+class Dialog(QtWidgets.QDialog, UI.TemplateUI):
+	"""Environment History panel class.
+
+	The panel is modeless and reads the HistoryBuffer of the environment
+	model. Listing the timeline only visits the deltas; a full snapshot is
+	only rebuilt when it is restored.
+	"""
+	def __init__(self, parent=None):
+		super(Dialog, self).__init__(parent)
+		self.parent = parent
+
+		# UI template setup
+		self.setupUI(**cfg)
+		self.conformFormLayoutLabels(self.ui)
+
+		# Set window icon, flags and other Qt attributes
+		self.setWindowFlags(QtCore.Qt.Dialog)
+
+		# Connect signals & slots
+		self.ui.key_lineEdit.textChanged.connect(self.refresh)
+		self.ui.history_treeWidget.itemSelectionChanged.connect(self.updateToolbarUI)
+		self.ui.restore_pushButton.clicked.connect(self.restore)
+		self.ui.buttonBox.button(QtWidgets.QDialogButtonBox.Close).clicked.connect(self.close)
+
+		self.shownKey = ("", "")  # (key as displayed, actual key)
+
+
+	def display(self, model, key=""):
+		"""Display the panel for the given environment model, optionally
+		showing the history of a single variable.
+		"""
+		self.model = model
+		self.shownKey = (envstore.displayValue(key), key)
+		self.ui.key_lineEdit.setText(self.shownKey[0])
+		self.refresh()
+		self.show()
+		self.raise_()
+
+
+	def refresh(self):
+		"""Repopulate the timeline, newest first."""
+
+		history = self.model.history
+		key = self.ui.key_lineEdit.text().strip()
+		if key == self.shownKey[0]:  # Only unescape the key as displayed
+			key = self.shownKey[1]
+		tree = self.ui.history_treeWidget
+		tree.clear()
+
+		if key:
+			tree.setHeaderLabels(["Time", "Event", "Value", "Previous Value"])
+			for index, snapshot, old, new in history.keyHistory(key):
+				item = self.snapshotEntry(index, snapshot)
+				item.setText(2, "(not set)" if new is None else envstore.displayValue(new))
+				item.setText(3, "(not set)" if old is None else envstore.displayValue(old))
+		else:
+			tree.setHeaderLabels(["Time", "Event", "Changes", "Previous Value"])
+			for index in range(len(history)-1, -1, -1):
+				snapshot = history.snapshots[index]
+				keys = sorted(snapshot.delta)
+				changes = ", ".join(envstore.displayValue(key) for key in keys[:KEYS_SHOWN])
+				if len(keys) > KEYS_SHOWN:
+					changes += " and %d more" % (len(keys) - KEYS_SHOWN)
+				item = self.snapshotEntry(index, snapshot)
+				item.setText(2, changes)
+		tree.resizeColumnToContents(0)
+
+		status = history.usage()
+		if history.dropped:
+			status += ", %d older snapshot(s) dropped" % history.dropped
+		self.ui.status_label.setText(status)
+		self.updateToolbarUI()
+
+
+	def snapshotEntry(self, index, snapshot):
+		"""Create a tree widget item for a snapshot."""
+
+		item = QtWidgets.QTreeWidgetItem(self.ui.history_treeWidget)
+		item.setText(0, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(snapshot.time)))
+		item.setText(1, snapshot.label)
+		item.setData(0, QtCore.Qt.UserRole, index)
+		return item
+
+
+	def updateToolbarUI(self):
+		"""Update the toolbar UI based on the current selection."""
+
+		self.ui.restore_pushButton.setEnabled(
+			len(self.ui.history_treeWidget.selectedItems()) > 0)
+
+
+	def restore(self):
+		"""Restore the selected point in the parent browser."""
+
+		for item in self.ui.history_treeWidget.selectedItems():
+			self.parent.restoreHistory(item.data(0, QtCore.Qt.UserRole))
+
+
+	def hideEvent(self, event):
+		"""Event handler for when window is hidden."""
+
+		self.storeWindow()  # Store window geometry
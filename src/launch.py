@@ -0,0 +1,164 @@
+#!/usr/bin/python
+
+# launch.py
+#
+# Mike Bonnington <mjbonnington@gmail.com>
+# (c) 2018-2022
+#
+# Run with this Environment
+# A panel for running commands with the environment as edited in the browser,
+# without saving it. Commands are spawned by a helper process, which is
+# started when the panel is first shown. Several commands can run at once;
+# the panel lists each one with its launch latency and exit status.
+
+
+import os
+import shlex
+
+from Qt import QtCore, QtGui, QtWidgets
+import ui_template as UI
+
+# Import custom modules
+import spawn_helper
+
+
+# ----------------------------------------------------------------------------
+# Configuration
+# ----------------------------------------------------------------------------
+
+cfg = dict(
+	app_id="ic_envvar",  # This should match the Rez package name
+	app_name="Run with this Environment",
+	window_object="launchUI",
+
+	ui_file=os.path.join(os.path.dirname(__file__), 'forms', 'launch.ui'),
+	stylesheet=None,
+
+	store_window_geometry=True,
+)
+
+# ----------------------------------------------------------------------------
+# Main dialog class
+# ----------------------------------------------------------------------------
+
+class Dialog(QtWidgets.QDialog, UI.TemplateUI):
+	"""Run with this Environment panel class.
+
+	The panel is modeless. Messages from the helper arrive on a reader
+	thread and are passed to the GUI thread through a queued signal, so the
+	GUI never waits for a launch.
+	"""
+	messageReceived = QtCore.Signal(object)
+
+	def __init__(self, parent=None):
+		super(Dialog, self).__init__(parent)
+		self.parent = parent
+
+		# UI template setup
+		self.setupUI(**cfg)
+
+		# Set window icon, flags and other Qt attributes
+		self.setWindowFlags(QtCore.Qt.Dialog)
+
+		# Connect signals & slots
+		self.ui.command_lineEdit.returnPressed.connect(self.run)
+		self.ui.command_lineEdit.textChanged.connect(self.updateToolbarUI)
+		self.ui.run_pushButton.clicked.connect(self.run)
+		self.ui.buttonBox.button(QtWidgets.QDialogButtonBox.Close).clicked.connect(self.close)
+		self.messageReceived.connect(self.handleMessage, QtCore.Qt.QueuedConnection)
+
+		self.helper = spawn_helper.SpawnHelper(self.messageReceived.emit)
+		self.launchItems = {}
+
+
+	def display(self, model):
+		"""Display the panel for the given environment model, starting the
+		helper process if it isn't already running.
+		"""
+		self.model = model
+		if not self.helper.running():
+			try:
+				self.helper.start()
+			except OSError as e:
+				self.ui.status_label.setText("Could not start spawn helper: %s" % e)
+			else:
+				self.ui.status_label.setText("Spawn helper started (PID %d)." % self.helper.process.pid)
+		self.updateToolbarUI()
+		self.show()
+		self.raise_()
+		self.ui.command_lineEdit.setFocus()
+
+
+	def updateToolbarUI(self):
+		"""Update the toolbar UI based on the command entered."""
+
+		self.ui.run_pushButton.setEnabled(
+			self.ui.command_lineEdit.text().strip() != "")
+
+
+	def run(self):
+		"""Run the command with the current environment."""
+
+		command = self.ui.command_lineEdit.text().strip()
+		if not command:
+			return
+
+		shell = self.getCheckBoxValue(self.ui.shell_checkBox)
+		if shell:
+			args = command
+		else:
+			args = shlex.split(command, posix=os.name != 'nt')
+
+		try:
+			requestId = self.helper.launch(self.model.environ, args, shell=shell)
+		except (OSError, ValueError) as e:
+			self.ui.status_label.setText("Could not start spawn helper: %s" % e)
+			return
+
+		item = QtWidgets.QTreeWidgetItem(self.ui.launches_treeWidget)
+		item.setText(0, command)
+		item.setText(3, "Launching")
+		self.ui.launches_treeWidget.scrollToItem(item)
+		self.launchItems[requestId] = item
+
+
+	def handleMessage(self, message):
+		"""Update the list with a message from the helper."""
+
+		item = self.launchItems.get(message['id'])
+		if item is None:
+			return
+
+		if 'latency' in message:
+			latency = "%.1f ms" % (message['latency']*1000)
+			item.setText(2, latency)
+			item.setTextAlignment(2, QtCore.Qt.AlignRight)
+			self.ui.status_label.setText("Last launch: %s" % latency)
+		if 'pid' in message:
+			item.setText(1, str(message['pid']))
+			item.setText(3, "Running")
+			item.setToolTip(2, "Spawn: %.1f ms" % (message['spawn']*1000))
+		elif 'error' in message:
+			item.setText(3, "Failed: %s" % message['error'])
+			del self.launchItems[message['id']]
+		elif 'exit' in message:
+			item.setText(3, "Exited (%d)" % message['exit'])
+			del self.launchItems[message['id']]
+		elif 'lost' in message:
+			item.setText(3, "Unknown: %s" % message['lost'])
+			del self.launchItems[message['id']]
+		self.ui.launches_treeWidget.resizeColumnToContents(0)
+
+
+	def closeEvent(self, event):
+		"""Event handler for when window is closed. The helper is stopped;
+		commands it launched are left running.
+		"""
+		self.helper.stop()
+		super(Dialog, self).closeEvent(event)
+
+
+	def hideEvent(self, event):
+		"""Event handler for when window is hidden."""
+
+		self.storeWindow()  # Store window geometry
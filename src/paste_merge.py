@@ -0,0 +1,189 @@
+#!/usr/bin/python
+
+# paste_merge.py
+#
+# Mike Bonnington <mjbonnington@gmail.com>
+# (c) 2018-2022
+#
+# Paste Variables
+# A dialog for merging a block of pasted variables into the environment. New
+# variables and conflicts with existing values are listed together so they
+# can be resolved at once; the browser applies the result as a single batch.
+
+
+import os
+
+from Qt import QtCore, QtGui, QtWidgets
+import ui_template as UI
+
+# Import custom modules
+import bulk_keys
+import envstore
+
+
+# ----------------------------------------------------------------------------
+# Configuration
+# ----------------------------------------------------------------------------
+
+cfg = dict(
+	app_id="ic_envvar",  # This should match the Rez package name
+	app_name="Paste Variables",
+	window_object="pasteMergeUI",
+
+	ui_file=os.path.join(os.path.dirname(__file__), 'forms', 'paste_merge.ui'),
+	stylesheet=None,
+
+	store_window_geometry=False,
+)
+
+# Status of each pasted variable
+NEW = "New"
+CONFLICT = "Conflict"
+INVALID = "Invalid key"
+
+# ----------------------------------------------------------------------------
+# Merge functions
+# ----------------------------------------------------------------------------
+
+def computeMerge(environ, pasted):
+	"""Compare pasted variables with the environment. Return a tuple of lists
+	of the keys which are new, which conflict with an existing value, which
+	are identical to an existing value, and which are not valid names.
+
+	Keys are matched using the environment's key semantics.
+	"""
+	new = []
+	conflicts = []
+	unchanged = []
+	invalid = []
+	for key, value in pasted.items():
+		if not bulk_keys.VALID_KEY.match(key):
+			invalid.append(key)
+		elif key not in environ:
+			new.append(key)
+		elif environ[key] != value:
+			conflicts.append(key)
+		else:
+			unchanged.append(key)
+	return new, conflicts, unchanged, invalid
+
+# ----------------------------------------------------------------------------
+# Main dialog class
+# ----------------------------------------------------------------------------
+
+class Dialog(QtWidgets.QDialog, UI.TemplateUI):
+	"""Paste Variables dialog class."""
+
+	def __init__(self, parent=None):
+		super(Dialog, self).__init__(parent)
+		self.parent = parent
+
+		# UI template setup
+		self.setupUI(**cfg)
+
+		# Set window icon, flags and other Qt attributes
+		self.setWindowIcon(self.iconSet('edit.svg', tintNormal=False))
+		self.setWindowFlags(QtCore.Qt.Dialog)
+		self.setAttribute(QtCore.Qt.WA_DeleteOnClose, True)
+
+		# Connect signals & slots
+		self.ui.merge_treeWidget.itemChanged.connect(self.updateStatus)
+		self.ui.keepExisting_pushButton.clicked.connect(lambda: self.checkConflicts(False))
+		self.ui.replaceAll_pushButton.clicked.connect(lambda: self.checkConflicts(True))
+
+		self.ui.buttonBox.button(QtWidgets.QDialogButtonBox.Ok).setText("Paste")
+		self.ui.buttonBox.button(QtWidgets.QDialogButtonBox.Ok).clicked.connect(self.ok)
+		self.ui.buttonBox.button(QtWidgets.QDialogButtonBox.Cancel).clicked.connect(self.reject)
+
+		self.values = {}
+
+
+	def display(self, environ, pasted):
+		"""Display the dialog for the given environment and dictionary of
+		pasted variables. New variables and conflicts are checked by default;
+		variables with invalid names are listed but can't be pasted.
+		"""
+		self.pasted = pasted
+		new, conflicts, self.unchanged, invalid = computeMerge(environ, pasted)
+
+		tree = self.ui.merge_treeWidget
+		tree.setUpdatesEnabled(False)
+		tree.setSortingEnabled(False)
+		tree.blockSignals(True)
+		self.conflictItems = []
+		for key in new + conflicts:
+			item = QtWidgets.QTreeWidgetItem(tree)
+			item.setFlags(item.flags() | QtCore.Qt.ItemIsUserCheckable)
+			item.setCheckState(0, QtCore.Qt.Checked)
+			item.setText(0, envstore.displayValue(key))
+			item.setData(0, QtCore.Qt.UserRole, key)
+			item.setText(3, envstore.displayValue(pasted[key]))
+			if key in environ:
+				item.setText(1, CONFLICT)
+				item.setText(2, envstore.displayValue(environ[key]))
+				self.conflictItems.append(item)
+			else:
+				item.setText(1, NEW)
+		for key in invalid:
+			item = QtWidgets.QTreeWidgetItem(tree)
+			item.setFlags(QtCore.Qt.NoItemFlags)
+			item.setText(0, envstore.displayValue(key))
+			item.setText(1, INVALID)
+			item.setText(3, envstore.displayValue(pasted[key]))
+		tree.blockSignals(False)
+		tree.setSortingEnabled(True)
+		tree.sortByColumn(0, QtCore.Qt.AscendingOrder)
+		tree.resizeColumnToContents(0)
+		tree.setUpdatesEnabled(True)
+
+		self.ui.keepExisting_pushButton.setEnabled(bool(conflicts))
+		self.ui.replaceAll_pushButton.setEnabled(bool(conflicts))
+		self.updateStatus()
+
+		return self.exec_()
+
+
+	def checkConflicts(self, checked):
+		"""Check or uncheck all conflicting variables."""
+
+		state = QtCore.Qt.Checked if checked else QtCore.Qt.Unchecked
+		self.ui.merge_treeWidget.blockSignals(True)
+		for item in self.conflictItems:
+			item.setCheckState(0, state)
+		self.ui.merge_treeWidget.blockSignals(False)
+		self.updateStatus()
+
+
+	def checkedKeys(self):
+		"""Return a list of the checked keys."""
+
+		tree = self.ui.merge_treeWidget
+		return [tree.topLevelItem(i).data(0, QtCore.Qt.UserRole) for i in range(tree.topLevelItemCount())
+		        if tree.topLevelItem(i).checkState(0) == QtCore.Qt.Checked]
+
+
+	def updateStatus(self, *args):
+		"""Update the status label and buttons."""
+
+		count = len(self.checkedKeys())
+		status = "%d of %d variable(s) will be pasted." % (count, len(self.pasted))
+		if self.unchanged:
+			status += " %d already set to the same value." % len(self.unchanged)
+		self.ui.status_label.setText(status)
+		self.ui.buttonBox.button(QtWidgets.QDialogButtonBox.Ok).setEnabled(count > 0)
+
+
+	def ok(self):
+		"""Dialog accept function."""
+
+		self.values = dict((key, self.pasted[key]) for key in self.checkedKeys())
+		self.accept()
+
+
+	def keyPressEvent(self, event):
+		"""Event handler to detect when key is pressed."""
+
+		# Prevent Enter / Esc keypresses triggering OK / Cancel buttons.
+		if event.key() == QtCore.Qt.Key_Return \
+		or event.key() == QtCore.Qt.Key_Enter:
+			return
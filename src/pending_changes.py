@@ -0,0 +1,122 @@
+#!/usr/bin/python
+
+# pending_changes.py
+#
+# Mike Bonnington <mjbonnington@gmail.com>
+# (c) 2018-2022
+#
+# Pending Changes
+# A panel listing only the environment variables which differ from the live
+# environment, i.e. the changes that will be applied when the browser is
+# saved. Selected changes can be reverted.
+
+
+import os
+
+from Qt import QtCore, QtGui, QtWidgets
+import ui_template as UI
+
+# Import custom modules
+import envindex
+import envstore
+
+
+# ----------------------------------------------------------------------------
+# Configuration
+# ----------------------------------------------------------------------------
+
+cfg = dict(
+	app_id="ic_envvar",  # This should match the Rez package name
+	app_name="Pending Changes",
+	window_object="pendingChangesUI",
+
+	ui_file=os.path.join(os.path.dirname(__file__), 'forms', 'pending_changes.ui'),
+	stylesheet=None,
+
+	store_window_geometry=True,
+)
+
+# ----------------------------------------------------------------------------
+# Main dialog class
+# ----------------------------------------------------------------------------
+
+class Dialog(QtWidgets.QDialog, UI.TemplateUI):
+	"""Pending Changes panel class.
+
+	The panel is modeless and reads the ChangeTracker of the environment
+	model, so it only ever visits the changed variables.
+	"""
+	def __init__(self, parent=None):
+		super(Dialog, self).__init__(parent)
+		self.parent = parent
+
+		# UI template setup
+		self.setupUI(**cfg)
+
+		# Set window icon, flags and other Qt attributes
+		self.setWindowFlags(QtCore.Qt.Dialog)
+
+		# Connect signals & slots
+		self.ui.changes_treeWidget.itemSelectionChanged.connect(self.updateToolbarUI)
+		self.ui.changes_treeWidget.itemDoubleClicked.connect(self.showInBrowser)
+		self.ui.revert_pushButton.clicked.connect(self.revert)
+		self.ui.buttonBox.button(QtWidgets.QDialogButtonBox.Close).clicked.connect(self.close)
+
+
+	def display(self, model):
+		"""Display the panel for the given environment model."""
+
+		self.model = model
+		self.refresh()
+		self.show()
+		self.raise_()
+
+
+	def refresh(self):
+		"""Repopulate the list of changes."""
+
+		environ = self.model.environ
+		changes = self.model.changes
+		tree = self.ui.changes_treeWidget
+		tree.setSortingEnabled(False)
+		tree.clear()
+		for key, status in changes.status.items():
+			item = QtWidgets.QTreeWidgetItem(tree)
+			item.setText(0, envstore.displayValue(key))
+			item.setData(0, QtCore.Qt.UserRole, key)
+			item.setText(1, status)
+			if status != envindex.ADDED:
+				item.setText(2, envstore.displayValue(changes.baseline[key]))
+			if status != envindex.REMOVED:
+				item.setText(3, envstore.displayValue(environ[key]))
+		tree.setSortingEnabled(True)
+		tree.resizeColumnToContents(0)
+
+		self.ui.status_label.setText("%d pending change(s)" % len(changes))
+		self.updateToolbarUI()
+
+
+	def updateToolbarUI(self):
+		"""Update the toolbar UI based on the current selection."""
+
+		self.ui.revert_pushButton.setEnabled(
+			len(self.ui.changes_treeWidget.selectedItems()) > 0)
+
+
+	def revert(self):
+		"""Revert the selected changes in the parent browser."""
+
+		keys = [item.data(0, QtCore.Qt.UserRole) for item in self.ui.changes_treeWidget.selectedItems()]
+		self.parent.revertEnvVars(keys)
+
+
+	def showInBrowser(self, item, column):
+		"""Select the variable in the parent browser."""
+
+		self.parent.populateEnvVarList(selectItem=item.data(0, QtCore.Qt.UserRole))
+
+
+	def hideEvent(self, event):
+		"""Event handler for when window is hidden."""
+
+		self.storeWindow()  # Store window geometry
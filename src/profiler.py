@@ -0,0 +1,207 @@
+# profiler.py
+#
+# Mike Bonnington <mjbonnington@gmail.com>
+# (c) 2018-2022
+#
+# Hot-path Instrumentation
+#
+# Opt-in timing of the browser's key entry points. Set the environment
+# variable IC_ENVVAR_PROFILE to a non-zero value to enable it. Timings are
+# kept in rolling histograms and can be dumped to a trace file which can be
+# loaded into chrome://tracing or Perfetto. If IC_ENVVAR_PROFILE_TRACE is set
+# the trace is written to that path automatically when the browser is hidden.
+# When disabled, the 'timed' decorator returns the wrapped function unchanged
+# and 'span' returns a shared no-op context manager, so the cost is close to
+# zero.
+
+
+import collections
+import json
+import os
+import threading
+import time
+
+
+ENABLED = os.environ.get('IC_ENVVAR_PROFILE', '0') not in ('', '0')
+TRACE_FILE = os.environ.get('IC_ENVVAR_PROFILE_TRACE', '')
+
+HISTORY_LENGTH = 256  # Number of samples kept per histogram
+TRACE_LENGTH = 65536  # Maximum number of events kept for the trace file
+
+_histograms = collections.OrderedDict()
+_trace = collections.deque(maxlen=TRACE_LENGTH)
+_lock = threading.Lock()
+_epoch = time.perf_counter()
+
+now = time.perf_counter
+
+
+class Histogram(object):
+	"""Rolling histogram of durations (in seconds) for a single entry
+	point.
+	"""
+	def __init__(self, name, length=HISTORY_LENGTH):
+		self.name = name
+		self.samples = collections.deque(maxlen=length)
+		self.count = 0
+
+
+	def add(self, duration):
+		"""Add a sample."""
+
+		self.samples.append(duration)
+		self.count += 1
+
+
+	def last(self):
+		"""Return the most recent sample."""
+
+		return self.samples[-1] if self.samples else 0.0
+
+
+	def percentile(self, pc):
+		"""Return the given percentile of the samples currently held."""
+
+		if not self.samples:
+			return 0.0
+		ordered = sorted(self.samples)
+		index = min(len(ordered)-1, int(round(pc / 100.0 * (len(ordered)-1))))
+		return ordered[index]
+
+
+	def mean(self):
+		"""Return the mean of the samples currently held."""
+
+		if not self.samples:
+			return 0.0
+		return sum(self.samples) / len(self.samples)
+
+
+def record(name, start, end):
+	"""Record a timed event. 'start' and 'end' are perf_counter values."""
+
+	with _lock:
+		try:
+			histogram = _histograms[name]
+		except KeyError:
+			histogram = _histograms[name] = Histogram(name)
+		histogram.add(end - start)
+		_trace.append((name, start, end, threading.current_thread().ident))
+
+
+class _Span(object):
+	"""Context manager which times the enclosed block."""
+
+	__slots__ = ('name', 'start')
+
+	def __init__(self, name):
+		self.name = name
+
+	def __enter__(self):
+		self.start = time.perf_counter()
+		return self
+
+	def __exit__(self, *args):
+		record(self.name, self.start, time.perf_counter())
+		return False
+
+
+class _NullSpan(object):
+	"""Context manager which does nothing (profiling disabled)."""
+
+	__slots__ = ()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		return False
+
+_null_span = _NullSpan()
+
+
+def span(name):
+	"""Return a context manager which times the enclosed block."""
+
+	if ENABLED:
+		return _Span(name)
+	return _null_span
+
+
+def timed(name=None):
+	"""Decorator to time every call of the decorated function.
+
+	If profiling is disabled the function is returned unchanged.
+	"""
+	def decorator(func):
+		if not ENABLED:
+			return func
+
+		label = name or func.__name__
+
+		def wrapper(*args, **kwargs):
+			start = time.perf_counter()
+			try:
+				return func(*args, **kwargs)
+			finally:
+				record(label, start, time.perf_counter())
+
+		wrapper.__name__ = func.__name__
+		wrapper.__doc__ = func.__doc__
+		return wrapper
+
+	return decorator
+
+
+def histograms():
+	"""Return a list of the histograms recorded so far."""
+
+	with _lock:
+		return list(_histograms.values())
+
+
+def summary():
+	"""Return a short one-line summary of the last and p95 timings for each
+	entry point, suitable for displaying in a status bar.
+	"""
+	return "  ".join(
+		"%s %.1f/%.1fms" % (h.name, h.last()*1000, h.percentile(95)*1000)
+		for h in histograms())
+
+
+def report():
+	"""Return a multi-line report of all recorded timings."""
+
+	lines = ["%-24s %8s %10s %10s %10s" % ("entry point", "calls", "last ms", "mean ms", "p95 ms")]
+	for h in histograms():
+		lines.append("%-24s %8d %10.2f %10.2f %10.2f" % (
+			h.name, h.count, h.last()*1000, h.mean()*1000, h.percentile(95)*1000))
+	return "\n".join(lines)
+
+
+def dumpTrace(filepath=None):
+	"""Write the recorded events to a trace file in the Chrome trace event
+	format. Return the path written, or None if there was nothing to write.
+	"""
+	filepath = filepath or TRACE_FILE
+	if not filepath:
+		return None
+
+	with _lock:
+		events = [dict(
+			name=name, ph='X', pid=os.getpid(), tid=tid,
+			ts=(start-_epoch)*1e6, dur=(end-start)*1e6,
+		) for name, start, end, tid in _trace]
+
+	with open(filepath, 'w') as f:
+		json.dump(dict(traceEvents=events, displayTimeUnit='ms'), f)
+
+	return filepath
+
+
+def reset():
+	"""Clear all recorded timings."""
+
+	with _lock:
+		_histograms.clear()
+		_trace.clear()
@@ -0,0 +1,228 @@
+#!/usr/bin/python
+
+# spawn_helper.py
+#
+# Mike Bonnington <mjbonnington@gmail.com>
+# (c) 2018-2022
+#
+# Spawn Helper
+#
+# Launches commands with an edited environment without saving it to the
+# host's os.environ. Forking a multi-gigabyte host application for every
+# launch is slow, so a small helper process is started once, with the host's
+# own environment, and spawns the children itself. The helper's interpreter
+# runs isolated (-E -s), so PYTHONHOME or PYTHONPATH in the host environment
+# cannot break it. Each launch sends the differences between the edited
+# environment and the helper's over its stdin, as a line of JSON; the helper
+# replies on its stdout when the child has been spawned and again when it
+# exits. Undecodable bytes are carried as surrogate escapes, so
+# children receive the exact bytes.
+#
+# Run as a script this module is the helper; SpawnHelper is the client used by
+# the browser.
+
+
+import itertools
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+
+# ----------------------------------------------------------------------------
+# Helper process
+# ----------------------------------------------------------------------------
+
+_lock = threading.Lock()
+
+# Children write to a duplicate of the helper's stderr, which is the host's,
+# as stdout is the pipe to the client. Using a descriptor above 2 lets
+# subprocess use posix_spawn where it can.
+_childOutput = None
+
+
+def _reply(message):
+	"""Write a message to the client."""
+
+	with _lock:
+		sys.stdout.write(json.dumps(message) + "\n")
+		sys.stdout.flush()
+
+
+def _wait(requestId, process):
+	"""Wait for a child to exit and report its exit code."""
+
+	_reply(dict(id=requestId, exit=process.wait()))
+
+
+def _spawn(request):
+	"""Spawn a child for a launch request and report its process ID."""
+
+	global _childOutput
+
+	env = dict(os.environ)
+	env.update(request.get('set', {}))
+	for key in request.get('unset', []):
+		env.pop(key, None)
+
+	# subprocess only uses posix_spawn for an executable with a directory
+	# part, so look the command up on the child's PATH
+	args = request['args']
+	shell = request.get('shell', False)
+	executable = None
+	if not shell and args and not os.path.dirname(args[0]):
+		executable = shutil.which(args[0], path=env.get('PATH', os.defpath))
+
+	if _childOutput is None:
+		_childOutput = os.dup(sys.stderr.fileno())
+
+	start = time.perf_counter()
+	try:
+		# Not closing file descriptors is also required for posix_spawn
+		process = subprocess.Popen(
+			args, executable=executable, shell=shell,
+			cwd=request.get('cwd'), env=env, close_fds=False,
+			stdin=subprocess.DEVNULL, stdout=_childOutput)
+	except (OSError, ValueError) as e:
+		_reply(dict(id=request['id'], error=str(e)))
+		return
+	_reply(dict(id=request['id'], pid=process.pid, spawn=time.perf_counter()-start))
+
+	thread = threading.Thread(target=_wait, args=(request['id'], process))
+	thread.daemon = True
+	thread.start()
+
+
+def main():
+	"""Read launch requests until the client closes the pipe."""
+
+	for line in iter(sys.stdin.readline, ''):
+		try:
+			request = json.loads(line)
+		except ValueError:
+			continue
+		_spawn(request)
+
+# ----------------------------------------------------------------------------
+# Client
+# ----------------------------------------------------------------------------
+
+def interpreter():
+	"""Return the Python interpreter to run the helper with.
+
+	Inside a host application sys.executable may be the host itself, so it
+	is only used if it looks like Python. IC_ENVVAR_PYTHON overrides the
+	choice.
+	"""
+	path = os.environ.get('IC_ENVVAR_PYTHON')
+	if path:
+		return path
+	if os.path.basename(sys.executable).lower().startswith('python'):
+		return sys.executable
+	return shutil.which('python3') or shutil.which('python') or sys.executable
+
+
+class SpawnHelper(object):
+	"""Client for a helper process.
+
+	'callback' is called with each message from the helper, from a reader
+	thread, so GUI code must pass it on to the main thread. Messages are
+	dictionaries with an 'id' and one of 'pid' (the child was spawned;
+	'latency' is the time from the request in seconds), 'error', 'exit' or
+	'lost' (the helper exited before reporting the outcome).
+	"""
+	def __init__(self, callback):
+		self.callback = callback
+		self.process = None
+		self.base = None
+		self._ids = itertools.count(1)
+		self._sent = {}
+		self._outstanding = set()  # Requests without an 'error' or 'exit'
+		self._lock = threading.Lock()
+
+
+	def running(self):
+		"""Return True if the helper process is running."""
+
+		return self.process is not None and self.process.poll() is None
+
+
+	def start(self):
+		"""Start the helper with the host's environment as it is now.
+		Launches send their differences from it.
+		"""
+		self.stop()
+		self.base = dict(os.environ)
+		self.process = subprocess.Popen(
+			[interpreter(), '-E', '-s', os.path.abspath(__file__)],
+			env=self.base, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+			universal_newlines=True)
+		thread = threading.Thread(target=self._read, args=(self.process,))
+		thread.daemon = True
+		thread.start()
+
+
+	def stop(self):
+		"""Stop the helper. Children which are still running are left
+		running.
+		"""
+		if self.running():
+			self.process.stdin.close()
+		self.process = None
+
+
+	def launch(self, environ, args, shell=False, cwd=None):
+		"""Ask the helper to run a command with the given environment, a
+		CompactEnviron. Return the request ID. The helper is started first
+		if necessary.
+		"""
+		if not self.running():
+			self.start()
+
+		added, removed, modified = environ.diff(self.base)
+		requestId = next(self._ids)
+		request = dict(
+			id=requestId, args=args, shell=shell, cwd=cwd or None,
+			set=dict((key, environ[key]) for key in added + modified),
+			unset=removed,
+		)
+		with self._lock:
+			self._sent[requestId] = time.perf_counter()
+			self._outstanding.add(requestId)
+		self.process.stdin.write(json.dumps(request) + "\n")
+		self.process.stdin.flush()
+		return requestId
+
+
+	def _read(self, process):
+		"""Reader thread: pass messages from the helper to the callback.
+		When the helper exits, report every request still outstanding as
+		lost.
+		"""
+		for line in iter(process.stdout.readline, ''):
+			try:
+				message = json.loads(line)
+			except ValueError:
+				continue
+			with self._lock:
+				if 'exit' in message or 'error' in message:
+					self._outstanding.discard(message['id'])
+				if 'exit' not in message:
+					sent = self._sent.pop(message['id'], None)
+					if sent is not None:
+						message['latency'] = time.perf_counter() - sent
+			self.callback(message)
+
+		with self._lock:
+			lost = sorted(self._outstanding)
+			self._outstanding.clear()
+			self._sent.clear()
+		for requestId in lost:
+			self.callback(dict(id=requestId, lost="spawn helper exited"))
+
+
+if __name__ == "__main__":
+	main()